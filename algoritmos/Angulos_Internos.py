@@ -10,15 +10,24 @@ from qgis.core import QgsProcessingMultiStepFeedback
 from qgis.core import QgsProcessingParameterVectorLayer
 from qgis.core import QgsProcessingParameterFeatureSink
 from qgis.core import QgsProcessingParameterNumber
+from qgis.core import QgsProcessingParameterBoolean
 from qgis.core import QgsProcessingUtils
+from qgis.core import QgsApplication, QgsFeatureSink, QgsWkbTypes
+from qgis.core import QgsFields, QgsField, QgsFeature, QgsGeometry, QgsPointXY
+from qgis.core import QgsSpatialIndex, QgsRectangle
 from qgis.core import QgsTextFormat, QgsTextBufferSettings
 from qgis.core import QgsPalLayerSettings, QgsVectorLayerSimpleLabeling
 from qgis.PyQt.QtGui import QColor, QFont, QIcon
 from qgis.core import QgsLineSymbol, QgsCategorizedSymbolRenderer, QgsRendererCategory
 from qgis.PyQt.QtCore import QCoreApplication
-import processing
+from PyQt5.QtCore import QVariant
+import numpy as np
 import os
 
+from .Funcoes_Crs import crsMetrico, transformacao, transformarXY
+from .Funcoes_Angulos import aneisPoligono, angulosAnel, grausMinSeg, arcosAngulos
+from .Funcoes_Angulos import nosTopologia, conferirNos
+
 class AngulosInternosAlgorithm(QgsProcessingAlgorithm):
     def initAlgorithm(self, config=None):
         self.addParameter(
@@ -28,66 +37,240 @@ class AngulosInternosAlgorithm(QgsProcessingAlgorithm):
                                      minValue=0.1, 
                                      defaultValue=3))
         
+        self.addParameter(
+        QgsProcessingParameterNumber('segmentos', 
+                                     'Segmentos do arco (por quarto de círculo)',
+                                     type=QgsProcessingParameterNumber.Integer, 
+                                     minValue=1, 
+                                     defaultValue=9))
+        
         self.addParameter(
         QgsProcessingParameterVectorLayer('poligono', 'Polígono', types=[QgsProcessing.TypeVectorPolygon]))
-        self.addParameter(QgsProcessingParameterVectorLayer('vertices', 'Vértices', types=[QgsProcessing.TypeVectorPoint]))
-        self.addParameter(QgsProcessingParameterFeatureSink('angInt', 'Ângulos Internos'))
+        self.addParameter(QgsProcessingParameterVectorLayer('vertices', 'Vértices (vazio = todos os vértices dos polígonos)',
+                                                            types=[QgsProcessing.TypeVectorPoint], optional=True))
+        self.addParameter(
+        QgsProcessingParameterNumber('tolerancia', 
+                                     'Tolerância para casar os Vértices com os Polígonos (m)',
+                                     type=QgsProcessingParameterNumber.Double, 
+                                     minValue=0, 
+                                     defaultValue=0.01))
+        self.addParameter(QgsProcessingParameterBoolean('topologia', 'Topologia: vértices comuns aos lotes vizinhos são um nó só',
+                                                        defaultValue=False))
+        self.addParameter(QgsProcessingParameterFeatureSink('angInt', 'Ângulos Internos', QgsProcessing.TypeVectorLine))
+        self.addParameter(QgsProcessingParameterFeatureSink('relatorio', 'Conferência dos Nós (soma 360°)',
+                                                            QgsProcessing.TypeVectorPoint,
+                                                            optional=True, createByDefault=False))
 
     def processAlgorithm(self, parameters, context, model_feedback):
         feedback = QgsProcessingMultiStepFeedback(2, model_feedback)
-        outputs = {}
-
-        parameters['angInt'].destinationName = 'Ângulos Internos'
-
-        # Buffer nos Vértices
-        alg_params = {
-            'INPUT': parameters['vertices'],
-            'DISSOLVE': False,
-            'DISTANCE': parameters['distancia'],
-            'END_CAP_STYLE': 0,  # Arredondado
-            'JOIN_STYLE': 0,     # Arredondado
-            'MITER_LIMIT': 2,
-            'SEGMENTS': 9,
-            'SEPARATE_DISJOINT': False,
-            'OUTPUT': QgsProcessing.TEMPORARY_OUTPUT
-        }
-        outputs['Buffer'] = processing.run('native:buffer', alg_params, context=context, feedback=feedback,
-                                           is_child_algorithm=True)
+        self.idSaida = None
+        self.resultados = {}
+
+        poligonos = self.parameterAsSource(parameters, 'poligono', context)
+        raio = self.parameterAsDouble(parameters, 'distancia', context)
+        segmentos = self.parameterAsInt(parameters, 'segmentos', context)
+        tolerancia = max(self.parameterAsDouble(parameters, 'tolerancia', context), 1e-6)
+        topologia = self.parameterAsBoolean(parameters, 'topologia', context)
+
+        # A distância do arco é em metros: camadas em graus são calculadas na zona UTM local
+        # e o resultado volta para o CRS do polígono
+        crsCamada = poligonos.sourceCrs()
+        crs = crsMetrico(crsCamada, poligonos.sourceExtent(), context.transformContext())
+        paraMetrico = transformacao(crsCamada, crs, context.transformContext())
+        paraCamada = transformacao(crs, crsCamada, context.transformContext())
+        if crs != crsCamada:
+            feedback.pushInfo(f'Polígono em {crsCamada.authid()}: cálculos em {crs.authid()}')
+
+        # =====Anéis de todos os polígonos=====================================
+        aneis = [] # (polígono, parte, anel, vértices)
+        atributos = {} # atributos de cada polígono, copiados para os seus arcos
+        total = poligonos.featureCount() or 1
+        for i, feat in enumerate(poligonos.getFeatures()):
+            if feedback.isCanceled():
+                return {}
+            feedback.setProgress(100 * i / total)
+
+            geom = feat.geometry()
+            if geom.isEmpty():
+                continue
+            if crs != crsCamada:
+                geom.transform(paraMetrico)
+            atributos[feat.id()] = feat.attributes()
+            aneis.extend((feat.id(), parte, k, anel) for parte, k, anel in aneisPoligono(geom) if len(anel) >= 3)
+
+        # Com topologia, os vértices dos lotes vizinhos a até 'tolerancia' viram um nó só,
+        # processado uma vez: todos os lotes usam a coordenada do nó e o índice espacial
+        # guarda os nós, não cada vértice de cada lote
+        if topologia:
+            todos = np.concatenate([anel for _, _, _, anel in aneis]) if aneis else np.empty((0, 2))
+            noVertice, nos = nosTopologia(todos[:, 0], todos[:, 1], tolerancia)
+            fimAnel = np.cumsum([len(anel) for _, _, _, anel in aneis], dtype=int)
+
+        # =====Ângulos de todos os anéis, uma passada por anel==================
+        # Um registro por vértice de anel, em colunas (um vértice comum a vários polígonos
+        # tem um registro, e um ângulo, em cada um). Com topologia, o ângulo é calculado já
+        # com as coordenadas dos nós: as arestas de todos os lotes em volta de um nó saem do
+        # mesmo ponto e chegam aos mesmos nós vizinhos, e os setores fecham 360°
+        nomes = ('poligono', 'parte', 'anel', 'vertice', 'no', 'angulo', 'inicio', 'x', 'y', 'idAnel')
+        colunas = {nome: [] for nome in nomes}
+        for idAnel, (poligono, parte, k, anel) in enumerate(aneis):
+            pos = np.arange(len(anel))
+            noAnel = np.full(len(anel), -1)
+            if topologia:
+                noAnel = noVertice[fimAnel[idAnel] - len(anel):fimAnel[idAnel]]
+                # vértices seguidos do anel que caíram no mesmo nó viram um só
+                manter = noAnel != np.roll(noAnel, 1)
+                pos, noAnel = pos[manter], noAnel[manter]
+                if len(pos) < 3:
+                    continue
+                anel = nos[noAnel]
+            angulo, inicio = angulosAnel(anel, furo=k > 0)
+            n = len(anel)
+            for nome, valor in zip(nomes, (np.full(n, poligono), np.full(n, parte), np.full(n, k), pos, noAnel,
+                                           angulo, inicio, anel[:, 0], anel[:, 1], np.full(n, idAnel))):
+                colunas[nome].append(valor)
+        colunas = {nome: np.concatenate(valor) if valor else np.empty(0) for nome, valor in colunas.items()}
+        del aneis
+
         feedback.setCurrentStep(1)
         if feedback.isCanceled():
             return {}
 
-        # Polígonos para linhas (a linha que define o ângulo)
-        alg_params = {
-            'INPUT': outputs['Buffer']['OUTPUT'],
-            'OUTPUT': QgsProcessing.TEMPORARY_OUTPUT
-        }
-        outputs['linhaAng'] = processing.run('native:polygonstolines', alg_params, context=context,
-                                                       feedback=feedback, is_child_algorithm=True)
-        feedback.setCurrentStep(2)
-        if feedback.isCanceled():
-            return {}
+        # =====Arcos dos vértices informados, com o ângulo nos atributos========
+        # Campos do polígono primeiro (como no native:intersection), depois os do ângulo; um campo
+        # do polígono com o mesmo nome de um dos nossos ganha o sufixo _2
+        nossos = ('poligono', 'parte', 'anel', 'vertice', 'no', 'ang_int_dec', 'ang_int_dms')
+        campos = QgsFields()
+        for campo in poligonos.fields():
+            campo = QgsField(campo)
+            if campo.name() in nossos:
+                campo.setName(campo.name() + '_2')
+            campos.append(campo)
+        campos.append(QgsField('poligono', QVariant.Int))
+        campos.append(QgsField('parte', QVariant.Int))
+        campos.append(QgsField('anel', QVariant.Int))
+        campos.append(QgsField('vertice', QVariant.Int))
+        campos.append(QgsField('no', QVariant.Int))
+        campos.append(QgsField('ang_int_dec', QVariant.Double))
+        campos.append(QgsField('ang_int_dms', QVariant.String))
+        (saida, self.idSaida) = self.parameterAsSink(parameters, 'angInt', context, campos,
+                                                     QgsWkbTypes.LineString, crsCamada)
 
-        # Interseção - Ângulo Interno
-        alg_params = {
-            'GRID_SIZE': None,
-            'INPUT': outputs['linhaAng']['OUTPUT'],
-            'INPUT_FIELDS': [''],
-            'OVERLAY': parameters['poligono'],
-            'OVERLAY_FIELDS': [''],
-            'OVERLAY_FIELDS_PREFIX': '',
-            'OUTPUT': parameters['angInt']
-        }
-
-        outputs['OUTPUT'] = processing.run('native:intersection', alg_params, context=context, feedback=feedback,
-                                             is_child_algorithm=True)
-        
-        self.SAIDA = outputs['OUTPUT']
-        
-        return {'angInt': self.SAIDA}
+        X, Y = colunas['x'], colunas['y']
+        if topologia:
+            no = colunas['no'].astype(int)
+            alvos = nos
+        else:
+            no = None
+            alvos = np.column_stack([X, Y])
+
+        # Sem camada de vértices, todos os vértices dos polígonos; com ela, cada ponto é casado
+        # pelo índice espacial com os nós/vértices dos polígonos a até 'tolerancia' (sem
+        # topologia, o vértice mais próximo de cada anel), sem testar todos os pares
+        vertices = self.parameterAsSource(parameters, 'vertices', context)
+        if vertices is None:
+            selecionados = np.arange(len(X))
+        else:
+            verticesMetrico = transformacao(vertices.sourceCrs(), crs, context.transformContext())
+            indiceEspacial = QgsSpatialIndex()
+            for j, (x, y) in enumerate(alvos.tolist()):
+                indiceEspacial.addFeature(j, QgsRectangle(x, y, x, y))
+
+            selecionados = []
+            total = vertices.featureCount() or 1
+            for i, feat in enumerate(vertices.getFeatures()):
+                if feedback.isCanceled():
+                    return {}
+                feedback.setProgress(50 * i / total)
+
+                geom = feat.geometry()
+                if geom.isEmpty():
+                    continue
+                pontos = transformarXY([[p.x(), p.y()] for p in geom.vertices()], verticesMetrico)
+                for px, py in pontos.tolist():
+                    ids = np.array(indiceEspacial.intersects(QgsRectangle(px - tolerancia, py - tolerancia,
+                                                                          px + tolerancia, py + tolerancia)), dtype=int)
+                    if not len(ids):
+                        continue
+                    distancia = np.hypot(alvos[ids, 0] - px, alvos[ids, 1] - py)
+                    ids = ids[np.argsort(distancia)][np.sort(distancia) <= tolerancia]
+                    if topologia:
+                        selecionados.extend(ids[:1].tolist())
+                    else:
+                        _, primeiro = np.unique(colunas['idAnel'][ids], return_index=True)
+                        selecionados.extend(ids[primeiro].tolist())
+            # um vértice repetido na camada de vértices sai uma vez só
+            selecionados = np.unique(np.array(selecionados, dtype=int))
+            if topologia: # todos os lotes dos nós escolhidos
+                selecionados = np.flatnonzero(np.isin(no, selecionados))
+
+        # Os arcos saem todos de uma vez, na ordem dos polígonos, e voltam ao CRS da camada
+        # numa transformação só
+        if len(selecionados):
+            poligono, parte, k, pos, angulo, inicio = (colunas[nome][selecionados] for nome in
+                                                       ('poligono', 'parte', 'anel', 'vertice',
+                                                        'angulo', 'inicio'))
+            centro = np.column_stack([X[selecionados], Y[selecionados]])
+            arcos, ini = arcosAngulos(centro, inicio, angulo, raio, segmentos)
+            arcos = transformarXY(arcos, paraCamada)
+            dms = grausMinSeg(angulo)
+            poligono, parte, k, pos = (coluna.astype(int).tolist() for coluna in (poligono, parte, k, pos))
+            noArco = no[selecionados].tolist() if topologia else [None] * len(selecionados)
+
+            for j in range(len(selecionados)):
+                if feedback.isCanceled():
+                    return {}
+                if j % 1000 == 0:
+                    feedback.setProgress(50 + 50 * j / len(selecionados))
+                nova_feature = QgsFeature(campos)
+                nova_feature.setAttributes(atributos[poligono[j]] + [poligono[j], parte[j], k[j], pos[j], noArco[j],
+                                                                     float(angulo[j]), dms[j]])
+                nova_feature.setGeometry(QgsGeometry.fromPolylineXY([QgsPointXY(x, y)
+                                                                     for x, y in arcos[ini[j]:ini[j + 1]]]))
+                saida.addFeature(nova_feature, QgsFeatureSink.FastInsert)
+
+        resultados = {'angInt': self.idSaida}
+
+        # =====Conferência da topologia (360° em volta de cada nó)==============
+        # Nós cercados por lotes somam 360°; nos da borda da quadra (ou com lacuna entre lotes)
+        # a soma é menor, e setores que avançam sobre o seguinte são lotes sobrepostos
+        if topologia and len(X):
+            soma, setores, sobreposto = conferirNos(no, colunas['inicio'], colunas['angulo'], len(nos))
+            fechado = np.abs(soma - 360.0) <= 1e-3
+            situacao = np.where(sobreposto, 'sobreposto', np.where(fechado, 'fechado', 'aberto'))
+            feedback.pushInfo(f'Topologia: {len(nos)} nós, {int(fechado.sum())} fechados (360°), '
+                              f'{int((~fechado & ~sobreposto).sum())} abertos, {int(sobreposto.sum())} com sobreposição')
+
+            camposNo = QgsFields()
+            camposNo.append(QgsField('no', QVariant.Int))
+            camposNo.append(QgsField('lotes', QVariant.Int))
+            camposNo.append(QgsField('soma', QVariant.Double))
+            camposNo.append(QgsField('diferenca', QVariant.Double))
+            camposNo.append(QgsField('situacao', QVariant.String))
+            (relatorio, idRelatorio) = self.parameterAsSink(parameters, 'relatorio', context, camposNo,
+                                                            QgsWkbTypes.Point, crsCamada)
+            if relatorio is not None:
+                nosCamada = transformarXY(nos, paraCamada)
+                for j, ((x, y), lotes, total, estado) in enumerate(zip(nosCamada.tolist(), setores.tolist(),
+                                                                       soma.tolist(), situacao.tolist())):
+                    nova_feature = QgsFeature(camposNo)
+                    nova_feature.setAttributes([j, lotes, total, 360.0 - total, estado])
+                    nova_feature.setGeometry(QgsGeometry.fromPointXY(QgsPointXY(x, y)))
+                    relatorio.addFeature(nova_feature, QgsFeatureSink.FastInsert)
+                resultados['relatorio'] = idRelatorio
+
+        self.resultados = resultados
+        return resultados
     
     def postProcessAlgorithm(self, context, feedback):
-        camada = QgsProcessingUtils.mapLayerFromString(self.SAIDA['OUTPUT'], context)
+        # Simbologia e rótulos só com a interface gráfica do QGIS. O retorno substitui os
+        # resultados do processAlgorithm: vai a cópia completa deles (com o relatório)
+        if QgsApplication.platform() != 'desktop' or self.idSaida is None:
+            return dict(self.resultados)
+
+        camada = QgsProcessingUtils.mapLayerFromString(self.idSaida, context)
+        if camada is None:
+            return dict(self.resultados)
         
         # Simbologia
         simbolo = QgsLineSymbol.createSimple({'color': 'red', 'width': '0.6'})
@@ -119,7 +302,7 @@ class AngulosInternosAlgorithm(QgsProcessingAlgorithm):
         
         camada.triggerRepaint() # Atualizar a interface do QGIS
 
-        return {'angInt': self.SAIDA['OUTPUT']}
+        return dict(self.resultados)
 
     def name(self):
         return 'Ângulos Internos'
@@ -149,7 +332,9 @@ class AngulosInternosAlgorithm(QgsProcessingAlgorithm):
     def icon(self):
         return QIcon(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'images/topoGeoone.png'))
     
-    texto = 'Este algoritmo calcula os ângulos internos dos vértices de uma camada de polígonos.'
+    texto = 'Este algoritmo calcula os ângulos internos dos vértices de uma camada de polígonos \
+             (campos ang_int_dec e ang_int_dms), direto das coordenadas dos anéis. \
+             Sem a camada de Vértices, são calculados os ângulos de todos os vértices.'
     figura = 'images/vect_polygon_angles.jpg'
 
     def shortHelpString(self):
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+__author__ = 'profCazaroli'
+__date__ = '2024-07-04'
+__copyright__ = '(C) 2024 by profCazaroli'
+__revision__ = '$Format:%H$'
+
+# Cache LRU em memória, com gravação opcional em disco, para reaproveitar resultados entre
+# execuções dos algoritmos na mesma sessão do QGIS (ou entre sessões)
+#
+# No disco os valores vão em .npz sem pickle: a estrutura (dicionários, listas, números e
+# textos) em JSON e os arrays e bytes como arrays NumPy. Ler um arquivo da pasta do cache
+# nunca executa código, mesmo que a pasta seja compartilhada ou o arquivo tenha sido trocado
+
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import sys
+import threading
+import zipfile
+
+import numpy as np
+
+def chaveCache(*partes):
+    # Hash das partes (bytes são usados direto; o resto pelo repr)
+    h = hashlib.sha1()
+    for parte in partes:
+        h.update(parte if isinstance(parte, bytes) else repr(parte).encode('utf-8'))
+        h.update(b'|')
+    return h.hexdigest()
+
+def tamanhoValor(valor):
+    # Bytes aproximados de um valor guardado: bytes/str pelo tamanho, arrays NumPy pelo nbytes
+    # e listas, tuplas e dicionários pela soma dos elementos
+    if isinstance(valor, (bytes, bytearray, str)):
+        return len(valor)
+    if hasattr(valor, 'nbytes'):
+        return int(valor.nbytes)
+    if isinstance(valor, dict):
+        return sum(tamanhoValor(k) + tamanhoValor(v) for k, v in valor.items())
+    if isinstance(valor, (list, tuple)):
+        return sum(tamanhoValor(v) for v in valor)
+    return sys.getsizeof(valor)
+
+def estruturaValor(valor, arrays):
+    # Estrutura do valor para o JSON, com os arrays (e bytes) guardados à parte em 'arrays';
+    # tuplas voltam como listas. Tipos sem representação segura levantam TypeError
+    if valor is None or isinstance(valor, (bool, int, float, str)):
+        return {'v': valor}
+    if isinstance(valor, np.generic):
+        return {'v': valor.item()}
+    if isinstance(valor, (bytes, bytearray)):
+        nome = f'a{len(arrays)}'
+        arrays[nome] = np.frombuffer(bytes(valor), dtype=np.uint8)
+        return {'b': nome}
+    if isinstance(valor, np.ndarray):
+        if valor.dtype.hasobject:
+            raise TypeError('array de objetos não vai para o cache em disco')
+        nome = f'a{len(arrays)}'
+        arrays[nome] = valor
+        return {'a': nome}
+    if isinstance(valor, dict):
+        if not all(isinstance(k, str) for k in valor):
+            raise TypeError('só dicionários com chaves de texto vão para o cache em disco')
+        return {'d': {k: estruturaValor(v, arrays) for k, v in valor.items()}}
+    if isinstance(valor, (list, tuple)):
+        if valor and all(isinstance(v, bytes) for v in valor):
+            # lista de WKB (geometrias): um array só com todos e outro com os limites
+            nome = f'a{len(arrays)}'
+            arrays[nome] = np.frombuffer(b''.join(valor), dtype=np.uint8)
+            arrays[nome + 'i'] = np.cumsum([0] + [len(v) for v in valor], dtype=np.int64)
+            return {'lb': nome}
+        return {'l': [estruturaValor(v, arrays) for v in valor]}
+    raise TypeError(f'{type(valor).__name__} não vai para o cache em disco')
+
+def montarValor(estrutura, arrays):
+    # Inverso de estruturaValor
+    tipo, conteudo = next(iter(estrutura.items()))
+    if tipo == 'v':
+        return conteudo
+    if tipo == 'b':
+        return arrays[conteudo].tobytes()
+    if tipo == 'a':
+        return arrays[conteudo]
+    if tipo == 'd':
+        return {k: montarValor(v, arrays) for k, v in conteudo.items()}
+    if tipo == 'l':
+        return [montarValor(v, arrays) for v in conteudo]
+    if tipo == 'lb':
+        dados, limites = arrays[conteudo].tobytes(), arrays[conteudo + 'i'].tolist()
+        return [dados[ini:fim] for ini, fim in zip(limites[:-1], limites[1:])]
+    raise ValueError(f'tipo desconhecido no cache: {tipo}')
+
+class CacheLRU:
+    def __init__(self, maxItens=128, maxBytes=0):
+        # maxBytes: limite da memória (0 = só pelo número de itens); um valor maior que o
+        # limite sozinho não fica na memória (só no disco, se houver pasta)
+        self.maxItens = maxItens
+        self.maxBytes = maxBytes
+        self.itens = OrderedDict()
+        self.tamanhos = {}
+        self.totalBytes = 0
+        self.trava = threading.Lock()
+        self.pasta = None
+        self.maxBytesDisco = 0
+
+    def definirPasta(self, pasta, maxBytesDisco=512 * 1024 * 1024):
+        # pasta vazia/None desliga o disco; ao passar do limite os arquivos mais antigos saem
+        self.pasta = pasta or None
+        self.maxBytesDisco = maxBytesDisco
+        if self.pasta:
+            os.makedirs(self.pasta, exist_ok=True)
+
+    def arquivo(self, chave):
+        return os.path.join(self.pasta, chave + '.npz')
+
+    def obter(self, chave):
+        with self.trava:
+            if chave in self.itens:
+                self.itens.move_to_end(chave)
+                return self.itens[chave]
+
+        if self.pasta and os.path.isfile(self.arquivo(chave)):
+            try:
+                with np.load(self.arquivo(chave), allow_pickle=False) as dados:
+                    arrays = {nome: dados[nome] for nome in dados.files}
+                valor = montarValor(json.loads(str(arrays.pop('estrutura'))), arrays)
+            except (OSError, ValueError, KeyError, StopIteration, AttributeError, zipfile.BadZipFile):
+                return None
+            os.utime(self.arquivo(chave)) # usado agora: vai para o fim da fila de remoção
+            self.guardarMemoria(chave, valor)
+            return valor
+
+        return None
+
+    def guardarMemoria(self, chave, valor):
+        tamanho = tamanhoValor(valor) if self.maxBytes else 0
+        with self.trava:
+            if chave in self.itens:
+                self.totalBytes -= self.tamanhos.pop(chave)
+                del self.itens[chave]
+            if self.maxBytes and tamanho > self.maxBytes:
+                return
+            self.itens[chave] = valor
+            self.tamanhos[chave] = tamanho
+            self.totalBytes += tamanho
+            while len(self.itens) > self.maxItens or (self.maxBytes and self.totalBytes > self.maxBytes):
+                antiga, _ = self.itens.popitem(last=False)
+                self.totalBytes -= self.tamanhos.pop(antiga)
+
+    def guardar(self, chave, valor):
+        self.guardarMemoria(chave, valor)
+
+        if self.pasta:
+            arrays = {}
+            try:
+                estrutura = json.dumps(estruturaValor(valor, arrays))
+            except TypeError:
+                return # fica só na memória
+            temporario = self.arquivo(chave) + '.tmp'
+            with open(temporario, 'wb') as arq:
+                np.savez(arq, estrutura=np.array(estrutura), **arrays)
+            os.replace(temporario, self.arquivo(chave))
+            self.limitarDisco()
+
+    def limitarDisco(self):
+        arquivos = []
+        for nome in os.listdir(self.pasta):
+            if nome.endswith('.npz'):
+                caminho = os.path.join(self.pasta, nome)
+                estado = os.stat(caminho)
+                arquivos.append((estado.st_mtime, estado.st_size, caminho))
+
+        total = sum(tamanho for _, tamanho, _ in arquivos)
+        for _, tamanho, caminho in sorted(arquivos):
+            if total <= self.maxBytesDisco:
+                break
+            try:
+                os.remove(caminho)
+            except OSError:
+                continue
+            total -= tamanho
+
+    def limpar(self):
+        with self.trava:
+            self.itens.clear()
+            self.tamanhos.clear()
+            self.totalBytes = 0
@@ -0,0 +1,387 @@
+# -*- coding: utf-8 -*-
+__author__ = 'profCazaroli'
+__date__ = '2024-06-18'
+__copyright__ = '(C) 2024 by profCazaroli'
+__revision__ = '$Format:%H$'
+
+from qgis.PyQt.QtCore import QCoreApplication
+from qgis.core import (QgsProcessing,
+                       QgsProcessingAlgorithm,
+                       QgsProcessingMultiStepFeedback,
+                       QgsProcessingParameterFeatureSink,
+                       QgsProcessingOutputLayerDefinition,
+                       QgsProcessingParameterVectorLayer,
+                       QgsProcessingParameterMultipleLayers,
+                       QgsProcessingParameterNumber,
+                       QgsProcessingParameterFile,
+                       QgsProcessingParameterEnum,
+                       QgsProcessingParameterString,
+                       QgsProcessingException,
+                       QgsFeatureSink,
+                       QgsFeatureRequest,
+                       QgsFeature,
+                       QgsFields,
+                       QgsField,
+                       QgsRectangle,
+                       QgsGeometry,
+                       QgsWkbTypes,
+                       QgsSpatialIndex,
+                       QgsDistanceArea)
+from PyQt5.QtCore import QVariant
+import math
+import os
+
+from .Cache_LRU import CacheLRU, chaveCache
+from .Funcoes_Crs import transformacao, crsMetrico
+from .Funcoes_Lotes import recortarApp, motorPreparado, geometriaWkb, linhasCorte, dividirGeometria
+from .Paralelo import executarEmFluxo
+
+# Geometrias de corte (buffers ou as próprias linhas) já calculadas nesta sessão do QGIS
+# (e, se houver pasta, em disco); na memória, até 256 MB de WKB
+CACHE_BUFFERS = CacheLRU(maxItens=16, maxBytes=256 * 1024 * 1024)
+
+TAM_BLOCO = 5000 # lotes lidos e gravados por vez
+LOTES_POR_TILE = 500 # lotes (que tocam algum buffer) por tarefa no modo APP
+MAX_LOTES_ESPERA = 20 * LOTES_POR_TILE # lotes em tiles ainda não enviados, no máximo
+
+def carimboFonte(camada):
+    # Data de modificação do arquivo da camada (None se não for arquivo: memória, banco...)
+    caminho = camada.source().split('|')[0]
+    return os.path.getmtime(caminho) if os.path.isfile(caminho) else None
+
+def lotesEmBlocos(lotes, feedback, tamBloco=None):
+    # Lê os lotes em blocos de tamBloco feições (requisições filtradas pelos ids), com progresso
+    # e cancelamento a cada bloco: só um bloco fica na memória de cada vez
+    tamBloco = tamBloco or TAM_BLOCO
+    pedido = QgsFeatureRequest().setFlags(QgsFeatureRequest.NoGeometry).setNoAttributes()
+    ids = [feat.id() for feat in lotes.getFeatures(pedido)]
+    for ini in range(0, len(ids), tamBloco):
+        if feedback.isCanceled():
+            return
+        feedback.setProgress(100 * ini / len(ids))
+        yield list(lotes.getFeatures(QgsFeatureRequest().setFilterFids(ids[ini:ini + tamBloco])))
+
+def indiceGeometrias(geometrias):
+    # Índice espacial de uma lista de geometrias (id = posição na lista)
+    indice = QgsSpatialIndex()
+    for j, geom in enumerate(geometrias):
+        indice.addFeature(j, geom.boundingBox())
+    return indice
+
+class dividirLotesAlgorithm(QgsProcessingAlgorithm):
+    def initAlgorithm(self, config=None):
+        opcao = QgsProcessingParameterEnum('escolha', 'Quebrar com ou sem Buffer?',
+                                           options=['Com Buffer', 'Sem Buffer'],
+                                           allowMultiple=False, defaultValue=0)
+        opcao.setMetadata({'widget_wrapper': {'class': 'processing.gui.wrappers.EnumWidgetWrapper',
+                                              'useCheckBoxes': True, 'columns': 2}})
+        self.addParameter(opcao)
+        self.addParameter(QgsProcessingParameterVectorLayer('lotes', 'Lotes',
+                                                            types=[QgsProcessing.TypeVectorPolygon,
+                                                                   QgsProcessing.TypeVectorLine],
+                                                            defaultValue='Lotes'))
+        self.addParameter(
+            QgsProcessingParameterVectorLayer('rio', 'Rio', types=[QgsProcessing.TypeVectorAnyGeometry],
+                                              defaultValue='Rio'))
+        self.addParameter(
+            QgsProcessingParameterMultipleLayers('linhas', 'Outras linhas de corte (estradas, servidões...)',
+                                                 layerType=QgsProcessing.TypeVectorAnyGeometry, optional=True))
+        self.addParameter(QgsProcessingParameterEnum('modo', 'Modo',
+                                                     options=['Dividir os lotes no contorno do buffer',
+                                                              'Faixas de APP: partes dentro e fora do buffer, com área'],
+                                                     defaultValue=0))
+        self.addParameter(QgsProcessingParameterNumber('distancia', 'Distância do Buffer (m)',
+                                                       type=QgsProcessingParameterNumber.Double,
+                                                       minValue=0.01, defaultValue=1.5))
+        self.addParameter(QgsProcessingParameterNumber('segmentos', 'Segmentos do Buffer',
+                                                       type=QgsProcessingParameterNumber.Integer,
+                                                       minValue=1, defaultValue=5))
+        self.addParameter(QgsProcessingParameterString('larguras', 'Larguras das faixas de APP (m, separadas por vírgula)',
+                                                       defaultValue='30,50,100'))
+        self.addParameter(QgsProcessingParameterNumber('trabalhadores', 'Tarefas em paralelo no modo APP (0 = todos os núcleos)',
+                                                       type=QgsProcessingParameterNumber.Integer,
+                                                       minValue=0, defaultValue=0))
+        self.addParameter(QgsProcessingParameterFile('pastaCache', 'Pasta do cache de buffers (opcional)',
+                                                     behavior=QgsProcessingParameterFile.Folder, optional=True))
+        self.addParameter(QgsProcessingParameterFeatureSink('lotesD', 'Lotes Divididos'))
+
+    def processAlgorithm(self, parameters, context, model_feedback):
+        feedback = QgsProcessingMultiStepFeedback(4, model_feedback)
+        results = {}
+
+        # Nome da camada no projeto; de scripts e do qgis_process a saída pode vir como texto (ou faltar)
+        if isinstance(parameters.get('lotesD'), QgsProcessingOutputLayerDefinition):
+            parameters['lotesD'].destinationName = 'Lotes_Divididos'
+
+        lotes = self.parameterAsVectorLayer(parameters, 'lotes', context)
+
+        # Rio e demais camadas de corte: todas vão para o mesmo índice espacial
+        camadas = [self.parameterAsVectorLayer(parameters, 'rio', context)]
+        for camada in self.parameterAsLayerList(parameters, 'linhas', context):
+            if camada.id() not in {c.id() for c in camadas}:
+                camadas.append(camada)
+        comBuffer = self.parameterAsEnum(parameters, 'escolha', context) == 0
+        distancia = self.parameterAsDouble(parameters, 'distancia', context)
+        segmentos = self.parameterAsInt(parameters, 'segmentos', context)
+        CACHE_BUFFERS.definirPasta(self.parameterAsFile(parameters, 'pastaCache', context))
+
+        if self.parameterAsEnum(parameters, 'modo', context) == 1:
+            if not comBuffer:
+                feedback.pushInfo('Faixas de APP são sempre calculadas com buffer (larguras das faixas)')
+            return self.faixasApp(parameters, context, feedback, lotes, camadas, segmentos)
+
+        # Geometrias de corte de todas as camadas (buffer ou a própria geometria), no CRS dos lotes
+        partes = []
+        for camada in camadas:
+            if feedback.isCanceled():
+                return {}
+            if not comBuffer and camada.geometryType() == QgsWkbTypes.PointGeometry:
+                feedback.reportError(f'{camada.name()}: pontos só cortam os lotes com buffer, camada ignorada')
+                continue
+            guardado = self.geometriasCorte(camada, lotes, distancia if comBuffer else None, segmentos,
+                                            context, feedback)
+            partes.extend(geometriaWkb(wkb) for wkb in guardado['geometrias'])
+        feedback.setCurrentStep(1)
+        if feedback.isCanceled():
+            return {}
+
+        # Um índice espacial só para todas as partes, com a geometria preparada e as linhas de
+        # corte de cada uma (contorno do buffer ou a linha); as linhas só são montadas na
+        # primeira vez que um lote as usa
+        indice = indiceGeometrias(partes)
+        motores = [motorPreparado(geom) for geom in partes]
+        cortes = {}
+        feedback.pushInfo(f'{len(partes)} geometria(s) de corte em {len(camadas)} camada(s)')
+
+        (lotesD, idLotesD) = self.parameterAsSink(parameters, 'lotesD', context, lotes.fields(),
+                                                  lotes.wkbType(), lotes.crs())
+        multi = QgsWkbTypes.isMultiType(lotes.wkbType())
+
+        # Os lotes passam em blocos, sem camadas temporárias: os que não tocam nenhuma geometria
+        # de corte (caixa envolvente no índice e depois a geometria preparada) vão direto para a
+        # saída e os demais são divididos por todas as linhas que tocam, de uma vez
+        divididos = 0
+        for bloco in lotesEmBlocos(lotes, feedback):
+            saida = []
+            for feat in bloco:
+                geom = feat.geometry()
+                perto = [j for j in indice.intersects(geom.boundingBox())
+                         if motores[j].intersects(geom.constGet())] if feat.hasGeometry() else []
+                if not perto:
+                    saida.append(feat)
+                    continue
+
+                for j in perto:
+                    if j not in cortes:
+                        cortes[j] = linhasCorte(partes[j])
+                pedacos = dividirGeometria(geom, [corte for j in perto for corte in cortes[j]])
+                divididos += len(pedacos) > 1
+                for pedaco in pedacos:
+                    if multi:
+                        pedaco.convertToMultiType()
+                    nova_feature = QgsFeature(feat)
+                    nova_feature.setGeometry(pedaco)
+                    saida.append(nova_feature)
+            lotesD.addFeatures(saida, QgsFeatureSink.FastInsert)
+        if feedback.isCanceled():
+            return {}
+        feedback.pushInfo(f'{divididos} de {lotes.featureCount()} lote(s) divididos')
+
+        results['LotesDivididos'] = idLotesD
+
+        return results
+
+    def geometriasCorte(self, camada, lotes, distancia, segmentos, context, feedback):
+        # Geometrias de corte de uma camada no CRS dos lotes: buffer de cada feição
+        # (distancia, em metros) ou a própria geometria (distancia None), em WKB
+        #
+        # Ficam no cache pela fonte da camada, pela data do arquivo, pelo CRS e pelos parâmetros:
+        # dividir outros lotes com a mesma hidrografia não refaz o buffer
+        crsLotes = lotes.crs()
+        # A distância é em metros: com lotes em graus o buffer é feito na zona UTM local
+        crs = crsLotes if distancia is None else crsMetrico(crsLotes, lotes.extent(), context.transformContext())
+        carimbo = carimboFonte(camada)
+        chave = None
+        if carimbo is not None:
+            chave = chaveCache(camada.source(), camada.subsetString(), carimbo, crsLotes.toWkt(),
+                               crs.toWkt(), distancia, segmentos)
+        guardado = CACHE_BUFFERS.obter(chave) if chave else None
+        if guardado is not None:
+            feedback.pushInfo(f'{camada.name()}: geometrias de corte reaproveitadas do cache')
+            return guardado
+
+        # Buffer direto na geometria (extremidades e junções arredondadas, como no native:buffer),
+        # sem camada temporária; a camada é reprojetada para o CRS do buffer e o resultado volta
+        # para o dos lotes
+        ct = transformacao(camada.crs(), crs, context.transformContext()) if camada.crs() != crs else None
+        paraLotes = transformacao(crs, crsLotes, context.transformContext()) if crs != crsLotes else None
+        if paraLotes is not None:
+            feedback.pushInfo(f'Lotes em {crsLotes.authid()}: buffers de {camada.name()} em {crs.authid()}')
+        geometrias = []
+        for feat in camada.getFeatures():
+            if feedback.isCanceled():
+                return {'crs': crsLotes.toWkt(), 'geometrias': []}
+            if not feat.hasGeometry():
+                continue
+            geom = feat.geometry()
+            if ct is not None:
+                geom.transform(ct)
+            if distancia is not None:
+                geom = geom.buffer(distancia, segmentos)
+                if paraLotes is not None:
+                    geom.transform(paraLotes)
+            if not geom.isEmpty():
+                geom.convertToMultiType()
+                geometrias.append(bytes(geom.asWkb()))
+        guardado = {'crs': crsLotes.toWkt(), 'geometrias': geometrias}
+        if chave:
+            CACHE_BUFFERS.guardar(chave, guardado)
+
+        return guardado
+
+    def faixasApp(self, parameters, context, feedback, lotes, camadas, segmentos):
+        # Modo APP: para cada lote e cada largura, lote ∩ buffer ('dentro') e lote − buffer
+        # ('fora'), com a área em m². Os lotes são lidos uma vez só, em blocos; os que tocam algum
+        # buffer são agrupados em tiles espaciais e cada tile vai para uma tarefa em paralelo
+        # assim que enche, com poucas tarefas na fila: a memória não cresce com a entrada
+        try:
+            larguras = sorted({float(x) for x in self.parameterAsString(parameters, 'larguras', context)
+                               .replace(';', ',').split(',') if x.strip()})
+        except ValueError:
+            raise QgsProcessingException('Larguras inválidas: use números separados por vírgula (ex.: 30,50,100)')
+        if not larguras:
+            raise QgsProcessingException('Informe ao menos uma largura de APP')
+        trabalhadores = self.parameterAsInt(parameters, 'trabalhadores', context)
+
+        # Buffers de cada largura, de todas as camadas (do cache, se não mudaram), com índice
+        # espacial das partes
+        faixas = []
+        for largura in larguras:
+            partes = []
+            for camada in camadas:
+                if feedback.isCanceled():
+                    return {}
+                guardado = self.geometriasCorte(camada, lotes, largura, segmentos, context, feedback)
+                partes.extend(geometriaWkb(wkb) for wkb in guardado['geometrias'])
+            faixas.append((largura, partes, indiceGeometrias(partes)))
+        feedback.setCurrentStep(1)
+
+        campos = QgsFields(lotes.fields())
+        campos.append(QgsField('largura', QVariant.Double))
+        campos.append(QgsField('situacao', QVariant.String))
+        campos.append(QgsField('area_m2', QVariant.Double))
+        (lotesD, idLotesD) = self.parameterAsSink(parameters, 'lotesD', context, campos,
+                                                  QgsWkbTypes.multiType(lotes.wkbType()), lotes.crs())
+
+        extensao = lotes.extent()
+        nTiles = max(1, lotes.featureCount() // LOTES_POR_TILE)
+        tamTile = max(extensao.width(), extensao.height(), 1e-9) / max(1, math.isqrt(nTiles))
+        crsWkt = lotes.crs().toWkt()
+        elipsoide = context.ellipsoid() or 'GRS80'
+        medidor = QgsDistanceArea()
+        medidor.setSourceCrs(lotes.crs(), context.transformContext())
+        medidor.setEllipsoid(elipsoide)
+
+        atributosTarefa = {} # índice da tarefa: {id do lote: atributos}, até gravar o resultado
+        contagem = {'lotes': 0, 'tarefas': 0}
+
+        def tarefaTile(tiles, chave):
+            # Lotes do tile e, por largura, a união só das partes do buffer que chegam perto deles
+            lotesTile = tiles.pop(chave)
+            caixa = QgsRectangle(lotesTile[0][2])
+            for _, _, c, _ in lotesTile[1:]:
+                caixa.combineExtentWith(c)
+            faixasTile = []
+            for largura, partes, indice in faixas:
+                perto = [partes[j] for j in indice.intersects(caixa)]
+                uniao = QgsGeometry.unaryUnion(perto) if perto else QgsGeometry()
+                faixasTile.append((largura, bytes(uniao.asWkb())))
+            atributosTarefa[contagem['tarefas']] = {loteId: atrib for loteId, _, _, atrib in lotesTile}
+            contagem['tarefas'] += 1
+            contagem['lotes'] += len(lotesTile)
+            return [(loteId, wkb) for loteId, wkb, _, _ in lotesTile], faixasTile, crsWkt, elipsoide
+
+        def tarefas():
+            # Uma passada pelos lotes, em blocos: quem não toca nenhum buffer sai direto ('fora'
+            # em todas as larguras, gravado com o bloco); os demais vão para o tile da grade que
+            # contém o centro da caixa envolvente, e o tile vira tarefa ao chegar a LOTES_POR_TILE
+            # lotes. Com mais de MAX_LOTES_ESPERA lotes esperando, o tile mais cheio sai antes
+            tiles = {}
+            espera = 0
+            for bloco in lotesEmBlocos(lotes, feedback):
+                fora = []
+                for feat in bloco:
+                    if not feat.hasGeometry():
+                        continue
+
+                    geom = feat.geometry()
+                    caixa = geom.boundingBox()
+                    if not any(indice.intersects(caixa) for _, _, indice in faixas):
+                        geom.convertToMultiType()
+                        area = medidor.measureArea(geom)
+                        for largura in larguras:
+                            nova_feature = QgsFeature(campos)
+                            nova_feature.setAttributes(feat.attributes() + [largura, 'fora', area])
+                            nova_feature.setGeometry(geom)
+                            fora.append(nova_feature)
+                        continue
+
+                    chave = (math.floor((caixa.center().x() - extensao.xMinimum()) / tamTile),
+                             math.floor((caixa.center().y() - extensao.yMinimum()) / tamTile))
+                    tiles.setdefault(chave, []).append((feat.id(), bytes(geom.asWkb()), caixa, feat.attributes()))
+                    espera += 1
+                    if len(tiles[chave]) >= LOTES_POR_TILE:
+                        espera -= len(tiles[chave])
+                        yield tarefaTile(tiles, chave)
+                lotesD.addFeatures(fora, QgsFeatureSink.FastInsert)
+
+                while espera > MAX_LOTES_ESPERA:
+                    chave = max(tiles, key=lambda c: len(tiles[c]))
+                    espera -= len(tiles[chave])
+                    yield tarefaTile(tiles, chave)
+
+            if feedback.isCanceled():
+                return
+            feedback.setCurrentStep(2)
+            for chave in sorted(tiles):
+                yield tarefaTile(tiles, chave)
+
+        # As operações são do GEOS pelo QgsGeometry: threads, não processos. Cada tile é gravado
+        # quando termina (um addFeatures por tile) e os atributos dele saem da memória
+        for i, resultado in executarEmFluxo(recortarApp, tarefas(), trabalhadores, feedback):
+            atributos = atributosTarefa.pop(i)
+            saida = []
+            for loteId, largura, situacao, wkb, area in resultado:
+                geom = geometriaWkb(wkb)
+                geom.convertToMultiType()
+                nova_feature = QgsFeature(campos)
+                nova_feature.setAttributes(atributos[loteId] + [largura, situacao, area])
+                nova_feature.setGeometry(geom)
+                saida.append(nova_feature)
+            lotesD.addFeatures(saida, QgsFeatureSink.FastInsert)
+        feedback.setCurrentStep(3)
+        if feedback.isCanceled():
+            return {}
+        feedback.pushInfo(f"{contagem['lotes']} lote(s) tocam a APP, em {contagem['tarefas']} tarefa(s)")
+
+        return {'LotesDivididos': idLotesD}
+
+    def name(self):
+        # mesmo nome do algoritmo antigo: modelos e scripts que chamam topoGeoone:Divide Lote(s) Buffer
+        # continuam funcionando
+        return 'Divide Lote(s) Buffer'
+
+    def displayName(self):
+        return 'Dividir Lote(s) com ou sem Buffer'
+
+    def group(self):
+        return 'Lotes'
+
+    def groupId(self):
+        return 'Lotes'
+
+    def tr(self, texto):
+        return QCoreApplication.translate('Processing', texto)
+
+    def createInstance(self):
+        return dividirLotesAlgorithm()
@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+__author__ = 'profCazaroli'
+__date__ = '2024-07-04'
+__copyright__ = '(C) 2024 by profCazaroli'
+__revision__ = '$Format:%H$'
+
+# Exportação da missão para os formatos dos aplicativos de voo
+#
+# As alturas vão sempre em relação ao ponto de decolagem (1º waypoint da missão): com MDE,
+# altitude do ponto - cota da decolagem, então o drone acompanha o terreno sem depender do
+# modelo de elevação do aplicativo. Os arquivos são gravados em blocos de no máximo tamBuffer
+# linhas
+
+from xml.sax.saxutils import escape
+import math
+import os
+
+TAM_BUFFER = 5000
+MAX_WAYPOINTS = 98 # o Litchi aceita até 99 waypoints por missão; número par: linhas inteiras
+
+def gravarEmBlocos(arquivo, linhas, tamBuffer=TAM_BUFFER):
+    buffer = []
+    for linha in linhas:
+        buffer.append(linha)
+        if len(buffer) >= tamBuffer:
+            arquivo.write(''.join(buffer))
+            buffer.clear()
+    if buffer:
+        arquivo.write(''.join(buffer))
+
+def gravarLitchiCsv(caminho, missoes, tamBuffer=TAM_BUFFER):
+    # Litchi Mission Hub: waypoints só nas pontas das Linhas de Voo, com fotos a cada
+    # photo_distinterval metros no trecho que sai do waypoint (-1 nas ligações entre linhas)
+    # altitudemode 0 = altura acima do ponto de decolagem; câmera apontada para baixo
+    # missoes: [(nome, [(longitude, latitude, altura, azimute, intervalo), ...])]
+    #
+    # Missões com mais de MAX_WAYPOINTS são divididas em partes; com um arquivo só ele é o
+    # próprio caminho, senão nome_<missao>[_<parte>].csv. Retorna a lista de arquivos
+    cabecalho = ('latitude,longitude,altitude(m),heading(deg),curvesize(m),rotationdir,'
+                 'gimbalmode,gimbalpitchangle,actiontype1,actionparam1,altitudemode,speed(m/s),'
+                 'poi_latitude,poi_longitude,poi_altitude(m),poi_altitudemode,'
+                 'photo_timeinterval,photo_distinterval\n')
+    base, extensao = os.path.splitext(caminho)
+
+    partes = []
+    for nome, waypoints in missoes:
+        blocos = [waypoints[i:i + MAX_WAYPOINTS] for i in range(0, len(waypoints), MAX_WAYPOINTS)]
+        partes.extend((nome, k if len(blocos) > 1 else None, bloco) for k, bloco in enumerate(blocos, 1))
+
+    def linhas(bloco):
+        for lon, lat, altura, azimute, intervalo in bloco:
+            yield (f'{lat:.8f},{lon:.8f},{altura:.2f},{azimute:.1f},0,0,'
+                   f'2,-90,-1,0,0,0,0,0,0,0,-1,{intervalo:.2f}\n')
+
+    arquivos = []
+    for nome, parte, bloco in partes:
+        if len(partes) == 1:
+            arquivo = caminho
+        else:
+            arquivo = f'{base}_{nome}{extensao}' if parte is None else f'{base}_{nome}_{parte}{extensao}'
+        with open(arquivo, 'w', encoding='utf-8', newline='') as saida:
+            saida.write(cabecalho)
+            gravarEmBlocos(saida, linhas(bloco), tamBuffer)
+        arquivos.append(arquivo)
+
+    return arquivos
+
+def gravarKml(caminho, linhasVoo, pontos, absoluto=False, tamBuffer=TAM_BUFFER):
+    # KML com uma pasta por missão: a Linha de Voo e os waypoints com os elementos wpml
+    # (índice e altura de execução, acima da decolagem) usados nas missões DJI
+    # linhasVoo: {missao: [(longitude, latitude), ...]}
+    # pontos: (missao, id, longitude, latitude, altitude, altura, azimute); absoluto: altitude em
+    # relação ao nível do mar (com MDE), senão altura acima do terreno. Altitude nan (missão
+    # toda fora do MDE): o waypoint vai com a altura acima do terreno
+    nome = escape(os.path.splitext(os.path.basename(caminho))[0])
+    modo = 'absolute' if absoluto else 'relativeToGround'
+
+    def linhas():
+        missaoAtual = None
+        for missao, pontoID, lon, lat, altitude, altura, azimute in pontos:
+            if missao != missaoAtual:
+                if missaoAtual is not None:
+                    yield '</Folder>\n'
+                missaoAtual = missao
+                yield f'<Folder><name>Missão {missao}</name>\n'
+                if missao in linhasVoo:
+                    coords = ' '.join(f'{x:.8f},{y:.8f}' for x, y in linhasVoo[missao])
+                    yield (f'<Placemark><name>Linha de Voo {missao}</name><LineString><tessellate>1</tessellate>'
+                           f'<coordinates>{coords}</coordinates></LineString></Placemark>\n')
+            modoPonto = modo
+            if math.isnan(altitude):
+                modoPonto, altitude = 'relativeToGround', altura
+            yield (f'<Placemark><name>{pontoID}</name><wpml:index>{pontoID}</wpml:index>'
+                   f'<wpml:executeHeight>{altura:.2f}</wpml:executeHeight>'
+                   f'<wpml:waypointHeadingAngle>{azimute:.1f}</wpml:waypointHeadingAngle>'
+                   f'<Point><altitudeMode>{modoPonto}</altitudeMode>'
+                   f'<coordinates>{lon:.8f},{lat:.8f},{altitude:.2f}</coordinates></Point></Placemark>\n')
+        if missaoAtual is not None:
+            yield '</Folder>\n'
+
+    with open(caminho, 'w', encoding='utf-8') as arquivo:
+        arquivo.write('<?xml version="1.0" encoding="UTF-8"?>\n'
+                      '<kml xmlns="http://www.opengis.net/kml/2.2" xmlns:wpml="http://www.dji.com/wpmz/1.0.2">\n'
+                      f'<Document><name>{nome}</name>\n')
+        gravarEmBlocos(arquivo, linhas(), tamBuffer)
+        arquivo.write('</Document>\n</kml>\n')
+
+    return [caminho]
+
+def exportarMissao(caminho, linhasVoo, pontos, missoes, absoluto=False, tamBuffer=TAM_BUFFER):
+    # Escolhe o formato pela extensão do arquivo e devolve a lista de arquivos gravados:
+    # o KML leva um waypoint por foto (pontos), o Litchi só as pontas das linhas (missoes)
+    if caminho.lower().endswith('.kml'):
+        return gravarKml(caminho, linhasVoo, pontos, absoluto, tamBuffer)
+    return gravarLitchiCsv(caminho, missoes, tamBuffer)
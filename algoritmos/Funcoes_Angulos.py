@@ -0,0 +1,187 @@
+# -*- coding: utf-8 -*-
+__author__ = 'profCazaroli'
+__date__ = '2024-06-20'
+__copyright__ = '(C) 2024 by profCazaroli'
+__revision__ = '$Format:%H$'
+
+# Ângulos internos dos vértices de polígonos, direto das coordenadas dos anéis,
+# com produtos vetoriais/escalares em NumPy (sem buffer nem interseção)
+
+import numpy as np
+
+def verticesAnel(anel):
+    # Vértices do anel sem o ponto de fechamento e sem vértices repetidos em sequência
+    anel = np.asarray(anel, dtype=float)
+    if len(anel) > 1 and np.array_equal(anel[0], anel[-1]):
+        anel = anel[:-1]
+    repetido = np.all(anel == np.roll(anel, 1, axis=0), axis=1)
+    repetido[0] = repetido[0] and len(anel) > 1
+    return anel[~repetido]
+
+def aneisPoligono(geom):
+    # (parte, anel, vértices) de todas as partes de uma QgsGeometry de polígono;
+    # o anel 0 de cada parte é o exterior
+    poligonos = geom.asMultiPolygon() if geom.isMultipart() else [geom.asPolygon()]
+    for parte, poligono in enumerate(poligonos):
+        for k, anel in enumerate(poligono):
+            if anel:
+                yield parte, k, verticesAnel([[p.x(), p.y()] for p in anel])
+
+def areaAnel(anel):
+    # Área com sinal (fórmula de Gauss): positiva se o anel for anti-horário
+    x, y = anel[:, 0], anel[:, 1]
+    return 0.5 * (np.dot(x, np.roll(y, -1)) - np.dot(np.roll(x, -1), y))
+
+def angulosAnel(anel, furo=False):
+    # anel: array (k, 2) com os vértices (sem fechamento, ver verticesAnel)
+    # furo: o anel é um furo do polígono (o interior do polígono fica do lado de fora dele)
+    #
+    # Retorna (ângulo interno em graus, direção inicial do arco em graus), por vértice.
+    # O ângulo interno vai da direção inicial, no sentido anti-horário, até a outra aresta;
+    # ângulos maiores que 180° são vértices reflexos
+    anterior = np.roll(anel, 1, axis=0) - anel
+    seguinte = np.roll(anel, -1, axis=0) - anel
+
+    # com o exterior anti-horário e os furos horários, o interior fica sempre à esquerda
+    sentido = 1.0 if (areaAnel(anel) > 0) != furo else -1.0
+    cruz = seguinte[:, 0] * anterior[:, 1] - seguinte[:, 1] * anterior[:, 0]
+    escalar = np.einsum('ij,ij->i', seguinte, anterior)
+    angulo = np.degrees(np.arctan2(sentido * cruz, escalar)) % 360
+
+    inicio = seguinte if sentido > 0 else anterior
+    return angulo, np.degrees(np.arctan2(inicio[:, 1], inicio[:, 0]))
+
+def grausMinSeg(graus):
+    # Ângulos decimais em texto ddd°mm'ss.ss"
+    segundos = np.round(np.asarray(graus, dtype=float) * 3600, 2)
+    g, resto = np.divmod(segundos, 3600)
+    m, s = np.divmod(resto, 60)
+    return [f'{gg:.0f}°{mm:02.0f}\'{ss:05.2f}"' for gg, mm, ss in zip(g, m, s)]
+
+def normalizarAzimute(azimute):
+    # Azimute arredondado como sai no texto (centésimo de segundo) e em [0, 360): um valor que
+    # arredonda para 360°00'00.00" vira 0°
+    return np.round(np.asarray(azimute, dtype=float) * 3600, 2) / 3600 % 360
+
+def rumoQuadrante(azimute):
+    # Rumo (ângulo a partir do Norte ou do Sul, até 90°) e quadrante (NE, SE, SO, NO) do azimute;
+    # azimutes exatamente sobre os eixos (no arredondamento do texto) saem como N, E, S ou O
+    azimute = normalizarAzimute(azimute)
+    quadrante = np.minimum((azimute // 90).astype(int), 3)
+    rumo = np.choose(quadrante, [azimute, 180 - azimute, azimute - 180, 360 - azimute])
+    sentido = np.array(['NE', 'SE', 'SO', 'NO'])[quadrante]
+    for eixo, cardeal in ((0, 'N'), (90, 'E'), (180, 'S'), (270, 'O')):
+        sentido[azimute == eixo] = cardeal
+    rumo = np.where(np.isin(azimute, (0, 180)), 0.0, np.where(np.isin(azimute, (90, 270)), 90.0, rumo))
+    return rumo, sentido
+
+def ladosAnel(anel, casasDistancia=2):
+    # Lado i: do vértice i ao i + 1 (o último fecha no primeiro)
+    # Retorna (azimute em graus, distância, erro de fechamento, perímetro). O erro de fechamento
+    # é o da poligonal refeita com os valores do memorial (azimute arredondado no segundo e
+    # distância em 'casasDistancia' casas), como numa poligonal levantada em campo
+    delta = np.roll(anel, -1, axis=0) - anel
+    distancia = np.hypot(delta[:, 0], delta[:, 1])
+    azimute = np.degrees(np.arctan2(delta[:, 0], delta[:, 1])) % 360
+
+    azMemorial = np.radians(np.round(azimute * 3600) / 3600)
+    distMemorial = np.round(distancia, casasDistancia)
+    erro = np.hypot(np.sum(distMemorial * np.sin(azMemorial)), np.sum(distMemorial * np.cos(azMemorial)))
+    return azimute, distancia, float(erro), float(distancia.sum())
+
+def arcosAngulos(centros, inicios, angulos, raios, segmentos=9):
+    # Arcos de todos os vértices numa única conta, como no buffer: 'segmentos' por quarto de
+    # círculo (no mínimo 1 por arco)
+    # centros (n, 2); inicios e angulos em graus (sentido anti-horário); raios (n,) ou escalar
+    #
+    # Retorna (pontos (P, 2), inicio (n + 1,)): o arco i são os pontos[inicio[i]:inicio[i + 1]]
+    centros = np.asarray(centros, dtype=float).reshape(-1, 2)
+    angulos = np.asarray(angulos, dtype=float)
+    raios = np.broadcast_to(np.asarray(raios, dtype=float), angulos.shape)
+
+    n = np.maximum(1, np.ceil(angulos / 90.0 * segmentos).astype(int)) # segmentos de cada arco
+    inicio = np.concatenate(([0], np.cumsum(n + 1)))
+    arco = np.repeat(np.arange(len(n)), n + 1)
+    j = np.arange(inicio[-1]) - inicio[arco] # posição do ponto dentro do arco
+
+    t = np.radians(np.asarray(inicios, dtype=float)[arco] + angulos[arco] * j / n[arco])
+    pontos = centros[arco] + raios[arco, None] * np.column_stack([np.cos(t), np.sin(t)])
+    return pontos, inicio
+
+def paresProximos(xy, tolerancia):
+    # Pares (i, j), cada um uma vez, de pontos a até 'tolerancia' um do outro. Índice espacial em grade:
+    # cada ponto só é comparado com os da sua célula e das 8 vizinhas (células do tamanho da
+    # tolerância), então pontos perto da borda de uma célula também são achados
+    celulas = np.floor((xy - xy.min(axis=0)) / tolerancia).astype(np.int64) + 1
+    largura = celulas[:, 1].max() + 2
+    chave = celulas[:, 0] * largura + celulas[:, 1]
+    ordem = np.argsort(chave, kind='stable')
+    chaveOrd = chave[ordem]
+
+    I, J = [], []
+    for dx, dy in ((0, 0), (0, 1), (1, -1), (1, 0), (1, 1)): # metade das vizinhas: cada par uma vez
+        alvo = chave + dx * largura + dy
+        ini = np.searchsorted(chaveOrd, alvo, side='left')
+        quantos = np.searchsorted(chaveOrd, alvo, side='right') - ini
+        i = np.repeat(np.arange(len(xy)), quantos)
+        j = ordem[np.repeat(ini, quantos) + np.arange(quantos.sum()) - np.repeat(np.cumsum(quantos) - quantos, quantos)]
+        manter = i < j if (dx, dy) == (0, 0) else np.ones(len(i), dtype=bool) # na própria célula, sem repetir
+        I.append(i[manter])
+        J.append(j[manter])
+    i, j = np.concatenate(I), np.concatenate(J)
+    perto = np.hypot(*(xy[i] - xy[j]).T) <= tolerancia
+    return i[perto], j[perto]
+
+def nosTopologia(x, y, tolerancia):
+    # Nós da topologia: vértices a até 'tolerancia' uns dos outros (distância, não célula de
+    # grade) viram um nó só, comum a todos os polígonos que passam por ele; a ligação é
+    # transitiva (union-find nos pares próximos)
+    #
+    # Retorna (nó de cada vértice, coordenadas (m, 2) de cada nó: média dos seus vértices)
+    xy = np.column_stack([x, y]).astype(float)
+    if not len(xy):
+        return np.empty(0, dtype=int), np.empty((0, 2))
+    i, j = paresProximos(xy, tolerancia)
+
+    # union-find vetorizado: cada vértice aponta para o menor vértice do seu grupo
+    raiz = np.arange(len(xy))
+    while True:
+        menor = np.minimum(raiz[i], raiz[j])
+        nova = raiz.copy()
+        np.minimum.at(nova, i, menor)
+        np.minimum.at(nova, j, menor)
+        np.minimum.at(nova, raiz, nova) # a raiz antiga também passa a apontar para a menor
+        nova = nova[nova]
+        if np.array_equal(nova, raiz):
+            break
+        raiz = nova
+
+    _, no = np.unique(raiz, return_inverse=True)
+    no = no.ravel()
+    quantos = np.bincount(no)
+    nos = np.column_stack([np.bincount(no, weights=xy[:, 0]), np.bincount(no, weights=xy[:, 1])]) / quantos[:, None]
+    return no, nos
+
+def conferirNos(no, inicio, angulo, nNos=None, tolAngulo=1e-3):
+    # Conferência dos ângulos em volta de cada nó, com os setores (início, ângulo) dos polígonos
+    # ordenados pela direção inicial: a soma tem de dar 360° quando o nó está cercado e nenhum
+    # setor pode passar do início do seguinte (polígonos sobrepostos)
+    #
+    # Retorna (soma dos ângulos, número de setores, há sobreposição), por nó (nNos nós, ou até
+    # o maior nó com setor)
+    m = nNos if nNos is not None else (no.max() + 1 if len(no) else 0)
+    soma = np.bincount(no, weights=angulo, minlength=m)
+    setores = np.bincount(no, minlength=m)
+
+    inicio = np.asarray(inicio) % 360
+    ordem = np.lexsort((inicio, no))
+    noOrd, iniOrd, angOrd = no[ordem], inicio[ordem], np.asarray(angulo)[ordem]
+    primeiro = np.searchsorted(noOrd, noOrd, side='left')
+    ultimo = np.searchsorted(noOrd, noOrd, side='right') - 1
+    seguinte = np.where(np.arange(len(noOrd)) == ultimo, primeiro, np.arange(len(noOrd)) + 1)
+    folga = (iniOrd[seguinte] - iniOrd) % 360
+    folga[seguinte == np.arange(len(noOrd))] = 360.0 # setor único no nó
+    sobreposto = np.zeros(m, dtype=bool)
+    np.logical_or.at(sobreposto, noOrd, angOrd > folga + tolAngulo)
+
+    return soma, setores, sobreposto
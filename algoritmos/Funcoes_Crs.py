@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+__author__ = 'profCazaroli'
+__date__ = '2024-07-04'
+__copyright__ = '(C) 2024 by profCazaroli'
+__revision__ = '$Format:%H$'
+
+# Sistemas de coordenadas: CRS métrico automático para camadas em graus e
+# transformações de arrays de coordenadas de uma vez só (sem laço ponto a ponto)
+
+from qgis.core import QgsCoordinateReferenceSystem, QgsCoordinateTransform, QgsLineString
+import numpy as np
+
+from .Cache_LRU import CacheLRU
+
+WGS84 = QgsCoordinateReferenceSystem('EPSG:4326')
+
+# Transformações já montadas, pelo par de CRS e pela operação que o contexto do projeto
+# escolhe para ele (montar a transformação é o que custa caro)
+CACHE_TRANSFORMACOES = CacheLRU(maxItens=32)
+
+def transformacao(origem, destino, contexto):
+    # A chave leva o que o contexto define para o par (operação escolhida pelo usuário e se
+    # pode cair para outra): projetos com datum/grade diferentes não dividem a transformação
+    chave = (origem.toWkt(), destino.toWkt(), contexto.calculateCoordinateOperation(origem, destino),
+             contexto.allowFallbackTransform(origem, destino))
+    ct = CACHE_TRANSFORMACOES.obter(chave)
+    if ct is None:
+        ct = QgsCoordinateTransform(origem, destino, contexto)
+        CACHE_TRANSFORMACOES.guardarMemoria(chave, ct)
+    return QgsCoordinateTransform(ct) # cópia: cada algoritmo usa a sua (pode estar em outra thread)
+
+def transformarXY(xy, ct):
+    # Array (n, 2) transformado numa chamada só, como os vértices de uma QgsLineString
+    xy = np.asarray(xy, dtype=float).reshape(-1, 2)
+    if len(xy) == 0 or ct.isShortCircuited():
+        return xy.copy()
+    linha = QgsLineString(xy[:, 0].tolist(), xy[:, 1].tolist())
+    linha.transform(ct)
+    return np.column_stack([np.array(linha.xVector()), np.array(linha.yVector())])
+
+def zonaUtm(lon, lat):
+    # EPSG da zona UTM (WGS84) que contém o ponto
+    zona = int((lon + 180) // 6) % 60 + 1
+    return (32600 if lat >= 0 else 32700) + zona
+
+def crsMetrico(crs, extensao, contexto):
+    # CRS em metros para os cálculos: o próprio crs se já for projetado ou, se for
+    # geográfico, a zona UTM do centro da extensão
+    if not crs.isGeographic():
+        return crs
+    centro = transformarXY([[extensao.center().x(), extensao.center().y()]],
+                           transformacao(crs, WGS84, contexto))[0]
+    return QgsCoordinateReferenceSystem(f'EPSG:{zonaUtm(centro[0], centro[1])}')
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+__author__ = 'profCazaroli'
+__date__ = '2024-06-20'
+__copyright__ = '(C) 2024 by profCazaroli'
+__revision__ = '$Format:%H$'
+
+# Operações de geometria dos lotes (GEOS pelo QgsGeometry): recorte da APP, com entrada e
+# saída em WKB para rodar em paralelo (um tile de lotes por tarefa), e divisão por linhas
+
+from qgis.core import QgsGeometry, QgsDistanceArea, QgsCoordinateReferenceSystem, QgsCoordinateTransformContext
+from qgis.core import QgsPoint, QgsWkbTypes
+
+def geometriaWkb(wkb):
+    geom = QgsGeometry()
+    geom.fromWkb(wkb)
+    return geom
+
+def motorPreparado(geom):
+    # Motor GEOS com a geometria preparada (testes intersects/contains rápidos)
+    motor = QgsGeometry.createGeometryEngine(geom.constGet())
+    motor.prepareGeometry()
+    return motor
+
+def recortarApp(lotes, faixas, crsWkt, elipsoide):
+    # lotes: [(id, wkb)] de um tile; faixas: [(largura, wkb da união dos buffers perto do tile)]
+    #
+    # Retorna [(id, largura, 'dentro' ou 'fora', wkb, área em m²)]: lote ∩ buffer e lote − buffer
+    # para cada largura. Lote fora do buffer (ou todo dentro dele) sai inteiro, sem recorte
+    medidor = QgsDistanceArea()
+    medidor.setSourceCrs(QgsCoordinateReferenceSystem.fromWkt(crsWkt), QgsCoordinateTransformContext())
+    medidor.setEllipsoid(elipsoide)
+
+    preparadas = []
+    for largura, wkb in faixas:
+        faixa = geometriaWkb(wkb)
+        preparadas.append((largura, faixa, None if faixa.isEmpty() else motorPreparado(faixa)))
+
+    resultados = []
+    for loteId, wkb in lotes:
+        lote = geometriaWkb(wkb)
+        for largura, faixa, motor in preparadas:
+            if motor is None or not motor.intersects(lote.constGet()):
+                pedacos = [('fora', lote)]
+            elif motor.contains(lote.constGet()):
+                pedacos = [('dentro', lote)]
+            else:
+                pedacos = [('dentro', lote.intersection(faixa)), ('fora', lote.difference(faixa))]
+
+            for situacao, pedaco in pedacos:
+                if pedaco.isEmpty():
+                    continue
+                resultados.append((loteId, largura, situacao, bytes(pedaco.asWkb()), medidor.measureArea(pedaco)))
+
+    return resultados
+
+def linhasCorte(geom):
+    # Linhas de corte de uma geometria: o contorno, se for polígono, ou as próprias linhas
+    # Retorna [(motor preparado da linha, pontos da linha)], uma por linha simples
+    if geom.type() == QgsWkbTypes.PolygonGeometry:
+        geom = QgsGeometry(geom.constGet().boundary())
+    linhas = geom.asMultiPolyline() if geom.isMultipart() else [geom.asPolyline()]
+    cortes = []
+    for linha in linhas:
+        if len(linha) > 1:
+            cortes.append((motorPreparado(QgsGeometry.fromPolylineXY(linha)), [QgsPoint(p) for p in linha]))
+    return cortes
+
+def dividirGeometria(geom, cortes):
+    # Divide a geometria (polígono ou linha, simples ou multiparte) por todas as linhas de
+    # corte, como o native:splitwithlines: cada pedaço resultante é cortado pelas linhas seguintes
+    # Cada linha é recortada antes na caixa do lote (um pouco maior, para ainda atravessá-lo):
+    # o splitGeometry custa pelo lote, não pelo número de vértices do rio ou da estrada inteira
+    # Retorna a lista de pedaços (partes simples); sem corte, a própria geometria
+    pedacos = [QgsGeometry(parte) for parte in geom.asGeometryCollection()] if geom.isMultipart() else [geom]
+    caixa = geom.boundingBox()
+    caixa = caixa.buffered(max(caixa.width(), caixa.height()) * 0.01 + 1e-6)
+    dividiu = False
+    for motor, pontos in cortes:
+        if not motor.intersects(geom.constGet()):
+            continue
+        recorte = QgsGeometry.fromPolyline(pontos).clipped(caixa)
+        trechos = recorte.asMultiPolyline() if recorte.isMultipart() else [recorte.asPolyline()]
+        for trecho in trechos:
+            if len(trecho) < 2:
+                continue
+            trecho = [QgsPoint(p) for p in trecho]
+            novos = []
+            for pedaco in pedacos:
+                if motor.intersects(pedaco.constGet()):
+                    pedaco = QgsGeometry(pedaco)
+                    _, partes, _ = pedaco.splitGeometry(trecho, False)
+                    dividiu = dividiu or bool(partes)
+                    novos.append(pedaco)
+                    novos.extend(partes)
+                else:
+                    novos.append(pedaco)
+            pedacos = novos
+    return pedacos if dividiu else [geom]
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+__author__ = 'profCazaroli'
+__date__ = '2024-07-04'
+__copyright__ = '(C) 2024 by profCazaroli'
+__revision__ = '$Format:%H$'
+
+# Leitura e gravação de rasters com o GDAL (que acompanha o QGIS)
+
+from osgeo import gdal
+import numpy as np
+
+def gravarGeoTiff(caminho, matriz, x0, y0, px, wkt, nodata=None):
+    # Grava a matriz (linhas, colunas) num GeoTIFF com canto superior esquerdo em (x0, y0)
+    tipos = {'int16': gdal.GDT_Int16, 'int32': gdal.GDT_Int32,
+             'float32': gdal.GDT_Float32, 'float64': gdal.GDT_Float64}
+
+    ny, nx = matriz.shape
+    ds = gdal.GetDriverByName('GTiff').Create(caminho, nx, ny, 1, tipos[matriz.dtype.name],
+                                              options=['COMPRESS=DEFLATE', 'TILED=YES'])
+    ds.SetGeoTransform((x0, px, 0, y0, 0, -px))
+    ds.SetProjection(wkt)
+
+    banda = ds.GetRasterBand(1)
+    if nodata is not None:
+        banda.SetNoDataValue(nodata)
+    banda.WriteArray(matriz)
+    banda.FlushCache()
+    ds = None # fecha o arquivo
+
+    return caminho
+
+def amostrarRaster(caminho, xs, ys, banda=1):
+    # Valores do raster nos pontos (xs, ys), lendo só os blocos do arquivo que têm pontos
+    # (o raster inteiro nunca é carregado na memória). Fora do raster ou nodata = nan
+    ds = gdal.Open(caminho, gdal.GA_ReadOnly)
+    b = ds.GetRasterBand(banda)
+    nodata = b.GetNoDataValue()
+    bx, by = b.GetBlockSize()
+    nx, ny = ds.RasterXSize, ds.RasterYSize
+
+    inv = gdal.InvGeoTransform(ds.GetGeoTransform())
+    xs, ys = np.asarray(xs, dtype=float), np.asarray(ys, dtype=float)
+    col = np.floor(inv[0] + inv[1] * xs + inv[2] * ys).astype(np.int64)
+    lin = np.floor(inv[3] + inv[4] * xs + inv[5] * ys).astype(np.int64)
+
+    valores = np.full(len(xs), np.nan)
+    dentro = np.flatnonzero((col >= 0) & (col < nx) & (lin >= 0) & (lin < ny))
+    if len(dentro) == 0:
+        return valores
+
+    # agrupa os pontos pelo bloco do raster em que caem
+    bloco = (lin[dentro] // by) * ((nx + bx - 1) // bx) + col[dentro] // bx
+    ordem = np.argsort(bloco, kind='stable')
+    dentro, bloco = dentro[ordem], bloco[ordem]
+    inicios = np.flatnonzero(np.r_[True, bloco[1:] != bloco[:-1]])
+
+    for i, fim in zip(inicios, np.r_[inicios[1:], len(bloco)]):
+        pontos = dentro[i:fim]
+        xoff, yoff = (col[pontos[0]] // bx) * bx, (lin[pontos[0]] // by) * by
+        janela = b.ReadAsArray(int(xoff), int(yoff), int(min(bx, nx - xoff)), int(min(by, ny - yoff)))
+        valores[pontos] = janela[lin[pontos] - yoff, col[pontos] - xoff]
+
+    if nodata is not None:
+        valores[valores == nodata] = np.nan
+
+    ds = None
+    return valores
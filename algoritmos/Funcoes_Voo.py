@@ -0,0 +1,482 @@
+# -*- coding: utf-8 -*-
+__author__ = 'profCazaroli'
+__date__ = '2024-07-04'
+__copyright__ = '(C) 2024 by profCazaroli'
+__revision__ = '$Format:%H$'
+
+# Funções geométricas do Plano de Voo, só com NumPy (sem QGIS), para serem
+# chamadas pelo algoritmo e testadas/reaproveitadas fora dele
+
+import numpy as np
+
+def eixosVoo(rumo):
+    # Vetor unitário ao longo da Linha de Voo (u) e vetor normal (v) à esquerda de u
+    u = np.array([np.cos(rumo), np.sin(rumo)])
+    v = np.array([-u[1], u[0]])
+
+    # Se o rumo aponta para Oeste inverte os eixos, para a 1ª linha ser sempre a mais ao Norte
+    if v[1] < 0 or (v[1] == 0 and v[0] < 0):
+        u, v = -u, -v
+
+    return u, v
+
+def gradeLinhas(vertices, u, v, deltaLat):
+    # Extensão das linhas ao longo de u e posição (em v) de cada linha, do Norte para o Sul
+    projU = vertices @ u  # coordenadas dos vértices ao longo das linhas
+    projV = vertices @ v  # e perpendiculares a elas
+
+    vMax = projV.max()
+    largura = vMax - projV.min()
+
+    espacamento = abs(deltaLat)
+    n = int(largura / espacamento) + 1  # número de Linhas do Norte para o Sul
+
+    return projU.min(), projU.max(), vMax - espacamento * np.arange(n)
+
+def linhasVoo(vertices, rumo, deltaLat):
+    # vertices: array (n, 2) com as coordenadas do Terreno
+    # rumo: ângulo (radianos, a partir do eixo X) da direção das Linhas de Voo
+    # deltaLat: espaçamento entre as Linhas de Voo (o sinal é ignorado)
+    #
+    # Retorna o caminho em serpentina (2m, 2): início e fim de cada uma das m linhas,
+    # já na ordem em que o drone voa (ida, volta, ida...)
+    vertices = np.asarray(vertices, dtype=float)
+    u, v = eixosVoo(rumo)
+    uMin, uMax, offsets = gradeLinhas(vertices, u, v, deltaLat)
+    n = len(offsets)
+
+    # extremos de todas as linhas: ida de uMin para uMax nas linhas pares e volta nas ímpares
+    inicio = np.where(np.arange(n) % 2 == 0, uMin, uMax)
+    fim = np.where(np.arange(n) % 2 == 0, uMax, uMin)
+
+    caminhoU = np.column_stack((inicio, fim)).ravel()
+    caminhoV = np.repeat(offsets, 2)
+
+    return np.outer(caminhoU, u) + np.outer(caminhoV, v)
+
+def cruzamentos(aneis, u, v, offsets):
+    # Interseções de todas as linhas (em v = offsets) com os lados do Terreno
+    #
+    # Os lados ficam "preparados" uma única vez no referencial (u, v) e indexados pelo
+    # intervalo de linhas que cada um atravessa, então cada linha só testa os lados próximos.
+    # Retorna (linha, u) de cada cruzamento
+    a = np.concatenate([anel[:-1] for anel in aneis])
+    b = np.concatenate([anel[1:] for anel in aneis])
+    au, av = a @ u, a @ v
+    bu, bv = b @ u, b @ v
+
+    # linhas no limite do Terreno são avaliadas um pouco para dentro dele
+    vMin, vMax = min(av.min(), bv.min()), max(av.max(), bv.max())
+    eps = 1e-9 * max(vMax - vMin, 1.0)
+    y = np.clip(offsets, vMin + eps, vMax - eps)
+
+    # índice: cada lado [baixo, alto) atravessa as linhas kIni..kFim (offsets decrescentes)
+    baixo, alto = np.minimum(av, bv), np.maximum(av, bv)
+    espacamento = offsets[0] - offsets[1] if len(offsets) > 1 else 1.0
+    kIni = np.clip(np.floor((y[0] - alto) / espacamento), 0, len(y) - 1).astype(int)
+    kFim = np.clip(np.ceil((y[0] - baixo) / espacamento), 0, len(y) - 1).astype(int)
+    contagem = np.where(alto > baixo, kFim - kIni + 1, 0)
+
+    lado = np.repeat(np.arange(len(a)), contagem)
+    inicioLado = np.repeat(np.cumsum(contagem) - contagem, contagem)
+    linha = kIni[lado] + np.arange(len(lado)) - inicioLado
+
+    yl = y[linha]
+    dentro = (baixo[lado] <= yl) & (yl < alto[lado])
+    lado, linha, yl = lado[dentro], linha[dentro], yl[dentro]
+
+    t = (yl - av[lado]) / (bv[lado] - av[lado])
+    return linha, au[lado] + t * (bu[lado] - au[lado])
+
+def linhasRecortadas(aneis, rumo, deltaLat, margem=0.0, janela=None):
+    # Linhas de Voo só nos trechos dentro do Terreno (regra par-ímpar, vale para furos),
+    # estendidas de margem nas duas pontas para a entrada/saída do drone
+    # janela: (uIni, uFim, kIni, kFim) limita às linhas kIni..kFim da grade do Terreno inteiro
+    # e ao intervalo uIni..uFim (mais a margem) ao longo delas, para dividir em missões
+    #
+    # Retorna os trechos (s, 2, 2) já na ordem e no sentido do voo em serpentina
+    aneis = [np.asarray(anel, dtype=float) for anel in aneis]
+    vertices = np.concatenate(aneis)
+    u, v = eixosVoo(rumo)
+    _, _, offsets = gradeLinhas(vertices, u, v, deltaLat)
+
+    if janela is not None:
+        offsets = offsets[janela[2]:janela[3] + 1]
+
+    linha, uc = cruzamentos(aneis, u, v, offsets)
+    if len(linha) == 0:
+        return np.empty((0, 2, 2))
+
+    ordem = np.lexsort((uc, linha))
+    linha, uc = linha[ordem][::2], uc[ordem].reshape(-1, 2)
+    u0, u1 = uc[:, 0] - margem, uc[:, 1] + margem
+
+    if janela is not None:
+        # só os trechos com parte dentro da janela (não apenas a margem)
+        manter = np.minimum(uc[:, 1], janela[1]) > np.maximum(uc[:, 0], janela[0])
+        u0, u1 = np.maximum(u0, janela[0] - margem), np.minimum(u1, janela[1] + margem)
+        if not manter.any():
+            return np.empty((0, 2, 2))
+        linha, uc, u0, u1 = linha[manter], uc[manter], u0[manter], u1[manter]
+
+    # junta trechos da mesma linha que se sobrepõem depois da margem
+    deslocamento = linha * 2 * (np.abs(uc).max() + margem + 1) # separa as linhas numa mesma escala
+    alcance = np.maximum.accumulate(u1 + deslocamento)
+    novo = np.ones(len(linha), dtype=bool)
+    novo[1:] = (linha[1:] != linha[:-1]) | (u0[1:] + deslocamento[1:] > alcance[:-1])
+    grupos = np.flatnonzero(novo)
+    linha, u0, u1 = linha[grupos], np.minimum.reduceat(u0, grupos), np.maximum.reduceat(u1, grupos)
+
+    # serpentina: alterna o sentido a cada linha voada (linhas vazias não contam)
+    sentido = np.cumsum(np.r_[True, linha[1:] != linha[:-1]]) % 2 == 0
+    ordem = np.lexsort((np.where(sentido, -u0, u0), linha))
+    linha, u0, u1, sentido = linha[ordem], u0[ordem], u1[ordem], sentido[ordem]
+
+    inicio = np.where(sentido, u1, u0)
+    fim = np.where(sentido, u0, u1)
+    trechosU = np.column_stack((inicio, fim))
+    trechosV = np.repeat(offsets[linha], 2).reshape(-1, 2)
+
+    return trechosU[..., None] * u + trechosV[..., None] * v
+
+def linhasJanela(aneis, rumo, deltaLat, janela):
+    # Linhas de Voo de uma missão sem recorte no Terreno: como linhasVoo, todas as linhas com o
+    # mesmo comprimento, mas só na parte do Terreno dentro da janela de dividirCampo
+    #
+    # Retorna o caminho em serpentina (2m, 2), vazio se a janela não pega o Terreno
+    trechos = linhasRecortadas(aneis, rumo, deltaLat, 0.0, janela)
+    if len(trechos) == 0:
+        return np.empty((0, 2))
+    u, v = eixosVoo(rumo)
+    _, _, offsets = gradeLinhas(np.concatenate(aneis), u, v, deltaLat)
+    offsets = offsets[janela[2]:janela[3] + 1]
+
+    pontos = trechos.reshape(-1, 2)
+    uMin, uMax = (pontos @ u).min(), (pontos @ u).max()
+    vMin, vMax = (pontos @ v).min(), (pontos @ v).max()
+    tolerancia = 1e-9 * max(abs(vMax), 1.0)
+    offsets = offsets[(offsets >= vMin - tolerancia) & (offsets <= vMax + tolerancia)]
+    n = len(offsets)
+
+    inicio = np.where(np.arange(n) % 2 == 0, uMin, uMax)
+    fim = np.where(np.arange(n) % 2 == 0, uMax, uMin)
+    return np.outer(np.column_stack((inicio, fim)).ravel(), u) + np.outer(np.repeat(offsets, 2), v)
+
+def dividirCampo(aneis, rumo, deltaLat, distanciaMax, margem=0.0):
+    # Janelas (uIni, uFim, kIni, kFim) de missões com percurso de até ~distanciaMax cada
+    # As missões usam a mesma grade de linhas do Terreno inteiro (espaçamento contínuo entre
+    # elas) e são quase quadradas: m linhas de comprimento ~m*espaçamento
+    # margem: entrada/saída das linhas recortadas, somada ao percurso de cada linha
+    aneis = [np.asarray(anel, dtype=float) for anel in aneis]
+    vertices = np.concatenate(aneis)
+    u, v = eixosVoo(rumo)
+    uMin, uMax, offsets = gradeLinhas(vertices, u, v, deltaLat)
+    n = len(offsets)
+    espacamento = abs(deltaLat)
+    comprimento = uMax - uMin
+
+    if n * (comprimento + 2 * margem) + (n - 1) * espacamento <= distanciaMax:
+        return [(uMin, uMax, 0, n - 1)]
+
+    # m linhas de largura + 2*margem e m - 1 ligações entre elas cabem em distanciaMax
+    def larguraMissao(m):
+        return (distanciaMax + espacamento) / m - espacamento - 2 * margem
+
+    m = max(1, int(np.sqrt(distanciaMax / espacamento))) # linhas por missão
+    while m > 1 and larguraMissao(m) < espacamento:
+        m -= 1
+    largura = max(larguraMissao(m), espacamento)
+
+    nu = max(1, int(np.ceil(comprimento / largura))) # missões ao longo das linhas
+    nk = max(1, int(np.ceil(n / m)))                  # e através delas
+    cortesU = np.linspace(uMin, uMax, nu + 1)
+    cortesK = np.linspace(0, n, nk + 1).round().astype(int)
+
+    return [(cortesU[i], cortesU[i + 1], cortesK[j], cortesK[j + 1] - 1)
+            for j in range(nk) for i in range(nu)]
+
+def pontosFotos(caminho, deltaFront):
+    # caminho: array (k, 2) com os vértices da Linha de Voo, na ordem do voo
+    # deltaFront: distância entre as fotos ao longo do caminho
+    #
+    # Retorna (pontos (p, 2), segmento de cada ponto), com os pontos a 0, deltaFront,
+    # 2*deltaFront... do início, numa única passada pelos comprimentos acumulados dos segmentos
+    caminho = np.asarray(caminho, dtype=float)
+    segmentos = np.diff(caminho, axis=0)
+    comprimentos = np.hypot(segmentos[:, 0], segmentos[:, 1])
+    acumulado = np.concatenate(([0.0], np.cumsum(comprimentos)))
+
+    distancias = np.arange(0.0, acumulado[-1], deltaFront)
+
+    # segmento de cada foto e a fração percorrida dentro dele
+    i = np.searchsorted(acumulado, distancias, side='right') - 1
+    i = np.clip(i, 0, len(segmentos) - 1)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        t = np.where(comprimentos[i] > 0, (distancias - acumulado[i]) / comprimentos[i], 0.0)
+
+    return caminho[i] + segmentos[i] * t[:, None], i
+
+def pontosTrechos(trechos, deltaFront):
+    # Pontos a cada deltaFront dentro de cada trecho (s, 2, 2), recomeçando no início de cada um
+    # Retorna (pontos (p, 2), trecho de cada ponto)
+    inicio = trechos[:, 0]
+    direcao = trechos[:, 1] - trechos[:, 0]
+    comprimentos = np.hypot(direcao[:, 0], direcao[:, 1])
+
+    contagem = np.ceil(comprimentos / deltaFront).astype(int)
+    trecho = np.repeat(np.arange(len(trechos)), contagem)
+    j = np.arange(len(trecho)) - np.repeat(np.cumsum(contagem) - contagem, contagem)
+
+    t = j * deltaFront / comprimentos[trecho]
+    return inicio[trecho] + direcao[trecho] * t[:, None], trecho
+
+def ladoMaisNorte(aneis):
+    # aneis: lista de arrays (k, 2), um por anel do Terreno (exterior e furos)
+    # Retorna (p1, p2) do lado com o ponto médio de maior Latitude
+    melhor = None
+    for anel in aneis:
+        medios = (anel[:-1, 1] + anel[1:, 1]) / 2
+        if len(medios) == 0:
+            continue
+        i = int(np.argmax(medios))
+        if melhor is None or medios[i] > melhor[0]:
+            melhor = (medios[i], anel[i], anel[i + 1])
+
+    return melhor[1], melhor[2]
+
+def envoltoriaConvexa(pontos):
+    # Envoltória convexa (cadeia monótona de Andrew), no sentido anti-horário e sem repetir o 1º ponto
+    pontos = np.unique(np.asarray(pontos, dtype=float), axis=0)
+    if len(pontos) < 3:
+        return pontos
+
+    def cadeia(seq):
+        c = []
+        for p in seq:
+            while len(c) >= 2 and ((c[-1][0] - c[-2][0]) * (p[1] - c[-2][1]) -
+                                   (c[-1][1] - c[-2][1]) * (p[0] - c[-2][0])) <= 0:
+                c.pop()
+            c.append(p)
+        return c
+
+    inferior = cadeia(pontos)
+    superior = cadeia(pontos[::-1])
+
+    return np.array(inferior[:-1] + superior[:-1])
+
+def comprimentoSerpentina(largura, comprimento, deltaLat):
+    # Número de linhas e distância total de voo (linhas + ligações) para uma faixa
+    # de largura x comprimento, do mesmo jeito que linhasVoo monta o caminho
+    espacamento = abs(deltaLat)
+    n = (largura / espacamento).astype(int) + 1
+    return n, n * comprimento + (n - 1) * espacamento
+
+def melhorRumo(vertices, deltaLat):
+    # Rumo que minimiza o número de linhas e, no empate, a distância total de voo
+    # A largura mínima de um polígono ocorre com um lado da envoltória convexa
+    # "encostado" no calibre (rotating calipers), então só os rumos desses lados são testados,
+    # todos de uma vez com projeções vetorizadas
+    envoltoria = envoltoriaConvexa(vertices)
+    lados = np.roll(envoltoria, -1, axis=0) - envoltoria
+    lados = lados[np.hypot(lados[:, 0], lados[:, 1]) > 0]
+
+    rumos = np.arctan2(lados[:, 1], lados[:, 0])
+    u = np.column_stack((np.cos(rumos), np.sin(rumos)))
+    v = np.column_stack((-u[:, 1], u[:, 0]))
+
+    projU = envoltoria @ u.T  # (pontos, candidatos)
+    projV = envoltoria @ v.T
+    comprimento = projU.max(axis=0) - projU.min(axis=0)
+    largura = projV.max(axis=0) - projV.min(axis=0)
+
+    n, distancia = comprimentoSerpentina(largura, comprimento, deltaLat)
+    melhor = np.lexsort((distancia, n))[0]
+
+    return rumos[melhor]
+
+def comprimentoCaminho(caminho):
+    if len(caminho) < 2:
+        return 0.0
+    return float(np.hypot(*np.diff(caminho, axis=0).T).sum())
+
+def azimutes(inicio, fim):
+    # Azimute (graus, a partir do Norte no sentido horário) de inicio para fim
+    d = np.asarray(fim, dtype=float) - np.asarray(inicio, dtype=float)
+    return np.degrees(np.arctan2(d[..., 0], d[..., 1])) % 360
+
+def rumoCampo(aneis, deltaLat, otimizar=False):
+    # Rumo das linhas: paralelo ao lado mais ao Norte ou, se otimizar, o de melhorRumo
+    aneis = [np.asarray(anel, dtype=float) for anel in aneis]
+    if otimizar:
+        return float(melhorRumo(np.concatenate(aneis), deltaLat))
+
+    p1, p2 = ladoMaisNorte(aneis)
+    return float(np.arctan2(p2[1] - p1[1], p2[0] - p1[0]))
+
+def linhasCampo(aneis, deltaLat, otimizar=False, margem=None, janela=None):
+    # Linhas de Voo de um Terreno (parte que só depende da geometria e do espaçamento lateral)
+    # otimizar: usa o melhor rumo (melhorRumo) em vez do lado mais ao Norte
+    # margem: se informada, recorta as linhas no Terreno (linhasRecortadas)
+    # janela: só a missão da janela de dividirCampo (recortada no Terreno só com margem)
+    aneis = [np.asarray(anel, dtype=float) for anel in aneis]
+    vertices = np.concatenate(aneis)
+    rumo = rumoCampo(aneis, deltaLat, otimizar)
+
+    trechos = None
+    if janela is not None:
+        if margem is not None:
+            trechos = linhasRecortadas(aneis, rumo, deltaLat, margem, janela)
+            caminho = trechos.reshape(-1, 2)
+        else:
+            caminho = linhasJanela(aneis, rumo, deltaLat, janela)
+        # economia só faz sentido para o Terreno inteiro
+        linhasNorte, comprimentoNorte = len(caminho) // 2, comprimentoCaminho(caminho)
+    else:
+        caminho = linhasVoo(vertices, rumoCampo(aneis, deltaLat), deltaLat)
+        linhasNorte, comprimentoNorte = len(caminho) // 2, comprimentoCaminho(caminho)
+
+        if otimizar:
+            caminho = linhasVoo(vertices, rumo, deltaLat)
+        if margem is not None:
+            trechos = linhasRecortadas(aneis, rumo, deltaLat, margem)
+            caminho = trechos.reshape(-1, 2)
+
+    return {'caminho': caminho,
+            'trechos': trechos,
+            'rumo': rumo,
+            'linhas': len(caminho) // 2,
+            'comprimento': comprimentoCaminho(caminho),
+            'linhasNorte': linhasNorte,
+            'comprimentoNorte': comprimentoNorte}
+
+def fotosCampo(linhas, deltaFront):
+    # Fotos a cada deltaFront sobre as linhas de linhasCampo: ao longo de todo o caminho ou,
+    # com as linhas recortadas, só nos trechos dentro do Terreno
+    # linhaFotos: linha de voo de cada foto (as fotos de uma ligação contam na linha anterior)
+    caminho, trechos = linhas['caminho'], linhas['trechos']
+    if trechos is None:
+        fotos, segmento = pontosFotos(caminho, deltaFront)
+        rumoFotos = azimutes(caminho[:-1], caminho[1:])[segmento]
+        linhaFotos = segmento // 2
+    else:
+        fotos, trecho = pontosTrechos(trechos, deltaFront)
+        rumoFotos = azimutes(trechos[:, 0], trechos[:, 1])[trecho]
+        linhaFotos = trecho
+
+    return dict(linhas, fotos=fotos, azimutes=rumoFotos, linhaFotos=linhaFotos)
+
+def planejarCampo(campo, aneis, deltaLat, deltaFront, otimizar=False, margem=None, janela=None, missao=0):
+    # Plano de Voo completo de um Terreno (ou de uma missão dele), só com arrays
+    # (pode rodar em outro processo)
+    # Retorna um dicionário com o caminho em serpentina, as fotos e as estatísticas do campo
+    plano = fotosCampo(linhasCampo(aneis, deltaLat, otimizar, margem, janela), deltaFront)
+    plano['campo'] = campo
+    plano['missao'] = missao
+    return plano
+
+def mascaraPoligono(aneis, x0, y0, px, nx, ny):
+    # Células (ny, nx) da grade (canto superior esquerdo x0, y0 e pixel px) com centro
+    # dentro do polígono, preenchidas linha a linha com os cruzamentos dos lados
+    mascara = np.zeros((ny, nx + 1), dtype=np.int32)
+    aneis = [np.asarray(anel, dtype=float) for anel in aneis]
+    ys = np.concatenate([anel[:, 1] for anel in aneis])
+
+    centros = y0 - (np.arange(ny) + 0.5) * px
+    linhas = np.flatnonzero((centros > ys.min()) & (centros < ys.max()))
+    if len(linhas) < 2:
+        return np.zeros((ny, nx), dtype=bool)
+
+    linha, xc = cruzamentos(aneis, np.array([1.0, 0.0]), np.array([0.0, 1.0]), centros[linhas])
+    ordem = np.lexsort((xc, linha))
+    linha, xc = linhas[linha[ordem][::2]], xc[ordem].reshape(-1, 2)
+
+    c0 = np.clip(np.ceil((xc[:, 0] - x0) / px - 0.5), 0, nx).astype(int)
+    c1 = np.clip(np.floor((xc[:, 1] - x0) / px - 0.5) + 1, 0, nx).astype(int)
+    np.add.at(mascara, (linha, c0), 1)
+    np.add.at(mascara, (linha, c1), -1)
+
+    return np.cumsum(mascara, axis=1)[:, :nx] > 0
+
+def acumularFotos(contagem, x0, y0, px, fotos, rumo, dLat, dFront):
+    # Soma em contagem (grade ny x nx) quantas fotos cobrem cada célula
+    # Cada foto cobre um retângulo dFront x dLat alinhado ao rumo das linhas. Os retângulos
+    # são acumulados numa grade no referencial do voo com somas de diferenças (4 cantos por
+    # foto + soma acumulada), e depois lidos nas células da grade do mapa
+    if len(fotos) == 0:
+        return
+
+    ny, nx = contagem.shape
+    u, v = eixosVoo(rumo)
+    pu, pv = fotos @ u, fotos @ v
+
+    u0, v0 = pu.min() - dFront / 2, pv.min() - dLat / 2
+    nu = int(np.ceil((pu.max() - pu.min() + dFront) / px)) + 1
+    nv = int(np.ceil((pv.max() - pv.min() + dLat) / px)) + 1
+
+    # índices das células (no referencial do voo) cujo centro está dentro de cada foto
+    i0 = np.ceil((pu - dFront / 2 - u0) / px - 0.5).astype(int)
+    i1 = np.floor((pu + dFront / 2 - u0) / px - 0.5).astype(int) + 1
+    j0 = np.ceil((pv - dLat / 2 - v0) / px - 0.5).astype(int)
+    j1 = np.floor((pv + dLat / 2 - v0) / px - 0.5).astype(int) + 1
+
+    diferencas = np.zeros((nu + 1, nv + 1), dtype=np.int32)
+    np.add.at(diferencas, (i0, j0), 1)
+    np.add.at(diferencas, (i1, j0), -1)
+    np.add.at(diferencas, (i0, j1), -1)
+    np.add.at(diferencas, (i1, j1), 1)
+    grade = np.cumsum(np.cumsum(diferencas, axis=0), axis=1)
+
+    # janela da grade do mapa que contém todas as fotos
+    cantos = np.array([[a, b] for a in (u0, u0 + nu * px) for b in (v0, v0 + nv * px)])
+    xs, ys = cantos @ np.array([u[0], v[0]]), cantos @ np.array([u[1], v[1]])
+    c0, c1 = np.clip([np.floor((xs.min() - x0) / px), np.ceil((xs.max() - x0) / px)], 0, nx).astype(int)
+    r0, r1 = np.clip([np.floor((y0 - ys.max()) / px), np.ceil((y0 - ys.min()) / px)], 0, ny).astype(int)
+    if c1 <= c0 or r1 <= r0:
+        return
+
+    cx = x0 + (np.arange(c0, c1) + 0.5) * px
+    cy = y0 - (np.arange(r0, r1) + 0.5) * px
+    gx, gy = np.meshgrid(cx, cy)
+    i = np.floor((gx * u[0] + gy * u[1] - u0) / px).astype(int)
+    j = np.floor((gx * v[0] + gy * v[1] - v0) / px).astype(int)
+
+    valido = (i >= 0) & (i < nu) & (j >= 0) & (j < nv)
+    janela = contagem[r0:r1, c0:c1]
+    janela[valido] += grade[i[valido], j[valido]]
+
+def ajusteTerreno(fotos, rumo, amostrar, H, deltaFront, deltaLat):
+    # Voo acompanhando o Terreno: cada foto a H acima do MDE, para manter o GSD constante
+    #
+    # amostrar(xy) devolve a cota do MDE nos pontos xy (nan fora dele). As declividades ao longo
+    # (u) e através (v) das linhas vêm de diferenças centrais, com todas as amostras num só lote,
+    # e corrigem os espaçamentos horizontais para manter a sobreposição medida no chão
+    # Retorna (cota, altitude, deltaFront, deltaLat) por foto
+    u, v = eixosVoo(rumo)
+    s = deltaFront / 2
+    deslocamentos = np.array([[0, 0], s * u, -s * u, s * v, -s * v])
+
+    amostras = (fotos[None, :, :] + deslocamentos[:, None, :]).reshape(-1, 2)
+    z = amostrar(amostras).reshape(5, len(fotos))
+
+    declividadeU = np.arctan((z[1] - z[2]) / (2 * s))
+    declividadeV = np.arctan((z[3] - z[4]) / (2 * s))
+
+    frente = np.where(np.isnan(declividadeU), deltaFront, deltaFront * np.cos(declividadeU))
+    lateral = np.where(np.isnan(declividadeV), abs(deltaLat), abs(deltaLat) * np.cos(declividadeV))
+
+    return z[0], z[0] + H, frente, lateral
+
+def cotasDecolagem(cota, grupo):
+    # Cota da decolagem de cada ponto: a 1ª cota válida (dentro do MDE) do seu grupo (missão),
+    # nan se o grupo inteiro está fora do MDE. Os pontos de cada grupo vêm seguidos
+    cota = np.asarray(cota, dtype=float)
+    grupo = np.asarray(grupo)
+    if len(cota) == 0:
+        return cota.copy()
+    inicio = np.flatnonzero(np.r_[True, grupo[1:] != grupo[:-1]])
+    idGrupo = np.repeat(np.arange(len(inicio)), np.diff(np.r_[inicio, len(cota)]))
+    validos = np.flatnonzero(~np.isnan(cota))
+    grupos, primeiro = np.unique(idGrupo[validos], return_index=True)
+    decolagem = np.full(len(inicio), np.nan)
+    decolagem[grupos] = cota[validos[primeiro]]
+    return decolagem[idGrupo]
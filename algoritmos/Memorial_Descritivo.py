@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+__author__ = 'profCazaroli'
+__date__ = '2024-06-20'
+__copyright__ = '(C) 2024 by profCazaroli'
+__revision__ = '$Format:%H$'
+
+from qgis.core import QgsProcessing
+from qgis.core import QgsProcessingAlgorithm
+from qgis.core import QgsProcessingParameterFeatureSource
+from qgis.core import QgsProcessingParameterFeatureSink
+from qgis.core import QgsProcessingParameterNumber
+from qgis.core import QgsFeatureSink, QgsWkbTypes
+from qgis.core import QgsFields, QgsField, QgsFeature
+from qgis.PyQt.QtGui import QIcon
+from qgis.PyQt.QtCore import QCoreApplication
+from PyQt5.QtCore import QVariant
+import os
+
+from .Funcoes_Crs import crsMetrico, transformacao
+from .Funcoes_Angulos import aneisPoligono, ladosAnel, rumoQuadrante, grausMinSeg, normalizarAzimute
+
+TAM_LOTE = 5000 # linhas da tabela gravadas por vez
+
+class MemorialDescritivoAlgorithm(QgsProcessingAlgorithm):
+    def initAlgorithm(self, config=None):
+        self.addParameter(QgsProcessingParameterFeatureSource('poligono', 'Polígono',
+                                                              types=[QgsProcessing.TypeVectorPolygon]))
+        self.addParameter(
+        QgsProcessingParameterNumber('casas',
+                                     'Casas decimais das distâncias',
+                                     type=QgsProcessingParameterNumber.Integer,
+                                     minValue=0,
+                                     maxValue=4,
+                                     defaultValue=2))
+        self.addParameter(QgsProcessingParameterFeatureSink('memorial', 'Memorial Descritivo', QgsProcessing.TypeVector))
+
+    def processAlgorithm(self, parameters, context, feedback):
+        poligonos = self.parameterAsSource(parameters, 'poligono', context)
+        casas = self.parameterAsInt(parameters, 'casas', context)
+
+        # Azimutes e distâncias no plano: camadas em graus são calculadas na zona UTM local
+        crsCamada = poligonos.sourceCrs()
+        crs = crsMetrico(crsCamada, poligonos.sourceExtent(), context.transformContext())
+        paraMetrico = transformacao(crsCamada, crs, context.transformContext())
+        if crs != crsCamada:
+            feedback.pushInfo(f'Polígono em {crsCamada.authid()}: cálculos em {crs.authid()}')
+
+        campos = QgsFields()
+        campos.append(QgsField('poligono', QVariant.Int))
+        campos.append(QgsField('parte', QVariant.Int))
+        campos.append(QgsField('anel', QVariant.Int))
+        campos.append(QgsField('lado', QVariant.Int))
+        campos.append(QgsField('de', QVariant.Int))
+        campos.append(QgsField('para', QVariant.Int))
+        campos.append(QgsField('este', QVariant.Double))
+        campos.append(QgsField('norte', QVariant.Double))
+        campos.append(QgsField('azimute', QVariant.Double))
+        campos.append(QgsField('azimute_dms', QVariant.String))
+        campos.append(QgsField('rumo', QVariant.String))
+        campos.append(QgsField('distancia', QVariant.Double))
+        campos.append(QgsField('perimetro', QVariant.Double))
+        campos.append(QgsField('erro_fechamento', QVariant.Double))
+        campos.append(QgsField('precisao', QVariant.Double)) # 1:precisao
+        (memorial, idMemorial) = self.parameterAsSink(parameters, 'memorial', context, campos,
+                                                      QgsWkbTypes.NoGeometry, crs)
+
+        # Cada anel é calculado de uma vez (todos os lados juntos) e as linhas vão para a
+        # tabela em lotes de TAM_LOTE: a camada inteira nunca fica na memória
+        lote = []
+        total = poligonos.featureCount() or 1
+        for i, feat in enumerate(poligonos.getFeatures()):
+            if feedback.isCanceled():
+                return {}
+            feedback.setProgress(100 * i / total)
+
+            geom = feat.geometry()
+            if geom.isEmpty():
+                continue
+            if crs != crsCamada:
+                geom.transform(paraMetrico)
+            for parte, k, anel in aneisPoligono(geom):
+                n = len(anel)
+                if n < 3:
+                    continue
+                azimute, distancia, erro, perimetro = ladosAnel(anel, casas)
+                azimute = normalizarAzimute(azimute)
+                rumo, quadrante = rumoQuadrante(azimute)
+                azDms = grausMinSeg(azimute)
+                rumoDms = grausMinSeg(rumo)
+                precisao = perimetro / erro if erro > 0 else None
+
+                for lado, (x, y, az, dms, r, q, d) in enumerate(zip(anel[:, 0].tolist(), anel[:, 1].tolist(),
+                                                                   azimute.tolist(), azDms, rumoDms,
+                                                                   quadrante.tolist(), distancia.tolist())):
+                    nova_feature = QgsFeature(campos)
+                    nova_feature.setAttributes([feat.id(), parte, k, lado + 1, lado + 1, (lado + 1) % n + 1,
+                                                x, y, az, dms, f'{r} {q}', round(d, casas),
+                                                round(perimetro, casas), erro, precisao])
+                    lote.append(nova_feature)
+
+                if len(lote) >= TAM_LOTE:
+                    memorial.addFeatures(lote, QgsFeatureSink.FastInsert)
+                    lote = []
+
+        if lote:
+            memorial.addFeatures(lote, QgsFeatureSink.FastInsert)
+
+        return {'memorial': idMemorial}
+
+    def name(self):
+        return 'Memorial Descritivo'
+
+    def displayName(self):
+        return self.tr('Memorial Descritivo (Azimutes e Distâncias)')
+
+    def group(self):
+        return 'Ângulos'
+
+    def groupId(self):
+        return 'Ângulos'
+
+    def tr(self, string):
+        return QCoreApplication.translate('Processing2', string)
+
+    def createInstance(self):
+        return MemorialDescritivoAlgorithm()
+
+    def tags(self):
+        return self.tr('memorial,descritivo,azimute,azimuth,rumo,bearing,distancia,distance,\
+                       fechamento,closure,incra,topography,polygon').split(',')
+
+    def icon(self):
+        return QIcon(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'images/topoGeoone.png'))
+
+    texto = 'Este algoritmo gera a tabela do memorial descritivo de uma camada de polígonos: \
+             para cada lado, os vértices, o azimute, o rumo com o quadrante e a distância, \
+             com o perímetro e o erro de fechamento de cada anel. A tabela pode ser gravada \
+             em CSV, ODS ou GeoPackage.'
+
+    def shortHelpString(self):
+        corpo = '''<div align="right">
+                      <p align="right">
+                      <b>'Autor: Prof Cazaroli'</b>
+                      </p>'Geoone'</div>
+                    </div>'''
+        return self.tr(self.texto) + corpo
@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+__author__ = 'profCazaroli'
+__date__ = '2024-07-04'
+__copyright__ = '(C) 2024 by profCazaroli'
+__revision__ = '$Format:%H$'
+
+# Execução de funções puras (só Python/NumPy) em vários processos, ou em threads para
+# funções que usam objetos do QGIS (as operações GEOS liberam o GIL)
+
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+from concurrent.futures.process import BrokenProcessPool
+import multiprocessing
+import os
+import sys
+
+def contextoProcessos():
+    # Dentro do QGIS o sys.executable pode ser o próprio QGIS (ex.: qgis-bin.exe no Windows),
+    # então os processos filhos são iniciados com o interpretador Python da instalação
+    contexto = multiprocessing.get_context('spawn')
+
+    executavel = os.path.basename(sys.executable or '').lower()
+    if executavel.startswith('python'):
+        return contexto
+
+    for nome in ('pythonw.exe', 'python.exe', 'python3', 'python'):
+        for pasta in (sys.exec_prefix, os.path.join(sys.exec_prefix, 'bin')):
+            candidato = os.path.join(pasta, nome)
+            if os.path.isfile(candidato):
+                contexto.set_executable(candidato)
+                return contexto
+
+    return None # sem interpretador: usar threads
+
+def executar(funcao, tarefas, trabalhadores=0, feedback=None, processos=True):
+    # Roda funcao(*tarefa) para cada tarefa e devolve os resultados na mesma ordem
+    # trabalhadores = 0 usa todos os núcleos; 1 roda tudo no processo atual
+    # processos = False usa threads direto
+    tarefas = list(tarefas)
+    if not tarefas:
+        return []
+
+    if trabalhadores <= 0:
+        trabalhadores = os.cpu_count() or 1
+    trabalhadores = min(trabalhadores, len(tarefas))
+
+    if trabalhadores == 1:
+        resultados = []
+        for i, tarefa in enumerate(tarefas):
+            if feedback is not None:
+                if feedback.isCanceled():
+                    return []
+                feedback.setProgress(100 * i / len(tarefas))
+            resultados.append(funcao(*tarefa))
+        return resultados
+
+    contexto = contextoProcessos() if processos else None
+    if contexto is not None:
+        try:
+            with ProcessPoolExecutor(trabalhadores, mp_context=contexto) as pool:
+                return coletar(pool, funcao, tarefas, feedback)
+        except (BrokenProcessPool, OSError):
+            pass # ambiente sem suporte a processos filhos: cai para threads
+
+    with ThreadPoolExecutor(trabalhadores) as pool:
+        return coletar(pool, funcao, tarefas, feedback)
+
+def coletar(pool, funcao, tarefas, feedback):
+    futuros = {pool.submit(funcao, *tarefa): i for i, tarefa in enumerate(tarefas)}
+    resultados = [None] * len(tarefas)
+
+    for n, futuro in enumerate(as_completed(futuros)):
+        if feedback is not None:
+            if feedback.isCanceled():
+                for pendente in futuros:
+                    pendente.cancel()
+                return []
+            feedback.setProgress(100 * n / len(tarefas))
+        resultados[futuros[futuro]] = futuro.result()
+
+    return resultados
+
+def executarEmFluxo(funcao, tarefas, trabalhadores=0, feedback=None, maxPendentes=0):
+    # Roda funcao(*tarefa) em threads, tirando as tarefas do iterável aos poucos: no máximo
+    # maxPendentes (padrão: 2 por trabalhador) ficam na fila ao mesmo tempo, então as tarefas
+    # podem ser geradas enquanto a entrada é lida, sem juntar todas na memória
+    # Gera (índice da tarefa, resultado) na ordem em que as tarefas terminam
+    if trabalhadores <= 0:
+        trabalhadores = os.cpu_count() or 1
+    maxPendentes = maxPendentes or 2 * trabalhadores
+    tarefas = iter(tarefas)
+
+    with ThreadPoolExecutor(trabalhadores) as pool:
+        pendentes = {}
+        indice = 0
+        acabou = False
+        while True:
+            while not acabou and len(pendentes) < maxPendentes:
+                tarefa = next(tarefas, None)
+                if tarefa is None or (feedback is not None and feedback.isCanceled()):
+                    acabou = True
+                    break
+                pendentes[pool.submit(funcao, *tarefa)] = indice
+                indice += 1
+            if not pendentes:
+                return
+
+            prontos, _ = wait(pendentes, return_when=FIRST_COMPLETED)
+            for futuro in prontos:
+                if feedback is not None and feedback.isCanceled():
+                    for pendente in pendentes:
+                        pendente.cancel()
+                    return
+                yield pendentes.pop(futuro), futuro.result()
@@ -4,19 +4,45 @@ __date__ = '2024-07-04'
 __copyright__ = '(C) 2024 by profCazaroli'
 __revision__ = '$Format:%H$'
 
-from qgis.core import QgsProcessing, QgsProject, QgsProcessingAlgorithm
+from qgis.core import QgsApplication, QgsProcessing, QgsProcessingAlgorithm, QgsProcessingUtils
 from qgis.core import QgsProcessingMultiStepFeedback
-from qgis.core import QgsProcessingParameterVectorLayer, QgsProcessingParameterNumber
+from qgis.core import QgsProcessingParameterVectorLayer, QgsProcessingParameterNumber, QgsProcessingParameterEnum
+from qgis.core import QgsProcessingParameterBoolean, QgsProcessingParameterRasterDestination
+from qgis.core import QgsProcessingParameterRasterLayer, QgsProcessingException
+from qgis.core import QgsProcessingParameterFeatureSink, QgsProcessingParameterFileDestination
+from qgis.core import QgsFeatureSink, QgsWkbTypes, QgsProcessingParameterFile, QgsProcessingOutputString
 from qgis.core import QgsTextFormat, QgsTextBufferSettings
 from qgis.core import QgsPalLayerSettings, QgsVectorLayerSimpleLabeling
-from qgis.core import QgsVectorLayer, QgsPoint, QgsPointXY, QgsField, QgsFields, QgsFeature, QgsGeometry
+from qgis.core import QgsPointXY, QgsField, QgsFields, QgsFeature, QgsGeometry
 from qgis.core import QgsMarkerSymbol, QgsSingleSymbolRenderer, QgsSimpleLineSymbolLayer, QgsLineSymbol
 from qgis.PyQt.QtCore import QCoreApplication
 from qgis.PyQt.QtGui import QColor, QFont, QIcon
 from PyQt5.QtCore import QVariant
-import processing
+import numpy as np
+import math
 import os
 
+from .Funcoes_Voo import planejarCampo, fotosCampo, acumularFotos, mascaraPoligono, ajusteTerreno
+from .Funcoes_Voo import rumoCampo, dividirCampo, azimutes, cotasDecolagem
+from .Funcoes_Raster import gravarGeoTiff, amostrarRaster
+from .Paralelo import executar
+from .Exportar_Missao import exportarMissao, TAM_BUFFER
+from .Cache_LRU import CacheLRU, chaveCache
+from .Pontos_Voo import PontosVoo, exportarPontos
+from .Funcoes_Crs import crsMetrico, transformacao, transformarXY, WGS84
+
+def aneisTerreno(geom):
+    # Anéis (exterior e furos) de todas as partes do polígono, como arrays (k, 2)
+    poligonos = geom.asMultiPolygon() if geom.isMultipart() else [geom.asPolygon()]
+    return [np.array([[p.x(), p.y()] for p in anel]) for poligono in poligonos for anel in poligono if anel]
+
+# Planos já calculados nesta sessão do QGIS (e, se houver pasta, em disco).
+# São duas chaves por campo (linhas e plano); o número de itens cresce com a camada
+# (ver processAlgorithm) e a memória fica presa pelos bytes
+CAMPOS_CACHE = 500
+CACHE_PLANOS = CacheLRU(maxItens=2 * CAMPOS_CACHE, maxBytes=512 * 1024 * 1024)
+VERSAO_PLANO = 2 # muda quando o conteúdo dos planos guardados muda (invalida o cache em disco)
+
 # Dados Air 2S (5472 × 3648)
 
 class PlanoVooAlgorithm(QgsProcessingAlgorithm):
@@ -40,21 +66,82 @@ class PlanoVooAlgorithm(QgsProcessingAlgorithm):
         self.addParameter(QgsProcessingParameterNumber('percF','Percentual de sobreposição Frontal (85% = 0.85)',
                                                        type=QgsProcessingParameterNumber.Double,
                                                        minValue=0.60,defaultValue=0.85))
+        self.addParameter(QgsProcessingParameterEnum('rumo', 'Direção das Linhas de Voo',
+                                                     options=['Paralelas ao lado mais ao Norte',
+                                                              'Otimizada (menos linhas e menor percurso)'],
+                                                     defaultValue=0))
+        self.addParameter(QgsProcessingParameterBoolean('recortar', 'Recortar as Linhas de Voo no Terreno',
+                                                        defaultValue=False))
+        self.addParameter(QgsProcessingParameterNumber('margem','Margem de entrada/saída das Linhas recortadas (m)',
+                                                       type=QgsProcessingParameterNumber.Double,
+                                                       minValue=0,defaultValue=10))
+        self.addParameter(QgsProcessingParameterNumber('velocidade','Velocidade de Voo (m/s)',
+                                                       type=QgsProcessingParameterNumber.Double,
+                                                       minValue=0.1,defaultValue=10))
+        self.addParameter(QgsProcessingParameterNumber('autonomia','Tempo máximo de cada Missão (min, 0 = sem dividir)',
+                                                       type=QgsProcessingParameterNumber.Double,
+                                                       minValue=0,defaultValue=0))
+        self.addParameter(QgsProcessingParameterRasterLayer('mde', 'MDE para acompanhar o Terreno (opcional)',
+                                                            optional=True))
+        self.addParameter(QgsProcessingParameterRasterDestination('cobertura', 'Cobertura das Fotos (sobreposição)',
+                                                                  optional=True, createByDefault=False))
+        self.addParameter(QgsProcessingParameterNumber('minFotos','Mínimo de fotos por ponto do Terreno',
+                                                       type=QgsProcessingParameterNumber.Integer,
+                                                       minValue=1,defaultValue=5))
+        self.addParameter(QgsProcessingParameterNumber('tamPixel','Tamanho do pixel da Cobertura (0 = automático)',
+                                                       type=QgsProcessingParameterNumber.Double,
+                                                       minValue=0,defaultValue=0))
+        self.addParameter(QgsProcessingParameterFileDestination('missao', 'Arquivo da Missão (Litchi CSV ou KML)',
+                                                                fileFilter='Litchi CSV (*.csv);;KML (*.kml)',
+                                                                optional=True, createByDefault=False))
+        self.addOutput(QgsProcessingOutputString('arquivosMissao', 'Arquivos da Missão (separados por ;)'))
+        self.addParameter(QgsProcessingParameterFileDestination('arquivoPontos', 'Arquivo dos Pontos (GeoPackage ou GeoParquet)',
+                                                                fileFilter='GeoPackage (*.gpkg);;GeoParquet (*.parquet);;GeoArrow (*.arrow)',
+                                                                optional=True, createByDefault=False))
+        self.addParameter(QgsProcessingParameterFile('pastaCache', 'Pasta do cache de planos (opcional)',
+                                                     behavior=QgsProcessingParameterFile.Folder, optional=True))
+        self.addParameter(QgsProcessingParameterNumber('trabalhadores','Processos em paralelo (0 = todos os núcleos)',
+                                                       type=QgsProcessingParameterNumber.Integer,
+                                                       minValue=0,defaultValue=0))
+        self.addParameter(QgsProcessingParameterFeatureSink('linhaVoo', 'Linha de Voo', QgsProcessing.TypeVectorLine))
+        self.addParameter(QgsProcessingParameterFeatureSink('pontos', 'Pontos', QgsProcessing.TypeVectorPoint))
+        self.addParameter(QgsProcessingParameterFeatureSink('estatisticas', 'Estatísticas do Voo', QgsProcessing.TypeVector))
         
     def processAlgorithm(self, parameters, context, model_feedback):
-        feedback = QgsProcessingMultiStepFeedback(2, model_feedback)
-        outputs = {}
+        feedback = QgsProcessingMultiStepFeedback(5, model_feedback)
+        self.idLinhaVoo = self.idPontos = None
+        self.resultados = {}
 
         # =====Parâmetros de entrada para variáveis========================
-        camada = self.parameterAsVectorLayer(parameters, 'terreno', context)
-        crs = camada.crs()
-
-        H = parameters['h']
-        dc = parameters['dc']
-        dl = parameters['dl']
-        f = parameters['f']
-        percL = parameters['percL'] # Lateral
-        percF = parameters['percF'] # Frontal
+        # A fonte de feições (e não a camada do projeto) pode ser lida fora da thread principal
+        camada = self.parameterAsSource(parameters, 'terreno', context)
+        crsCamada = camada.sourceCrs()
+
+        # Os espaçamentos são em metros: Terreno em graus é reprojetado uma vez para a zona UTM
+        # local, e as saídas voltam para o CRS da camada em lote (arrays inteiros)
+        crs = crsMetrico(crsCamada, camada.sourceExtent(), context.transformContext())
+        paraMetrico = transformacao(crsCamada, crs, context.transformContext())
+        paraCamada = transformacao(crs, crsCamada, context.transformContext())
+        paraWgs84 = transformacao(crs, WGS84, context.transformContext())
+        if crs != crsCamada:
+            feedback.pushInfo(f'Terreno em {crsCamada.authid()}: cálculos em {crs.authid()}')
+
+        H = self.parameterAsDouble(parameters, 'h', context)
+        dc = self.parameterAsDouble(parameters, 'dc', context)
+        dl = self.parameterAsDouble(parameters, 'dl', context)
+        f = self.parameterAsDouble(parameters, 'f', context)
+        percL = self.parameterAsDouble(parameters, 'percL', context) # Lateral
+        percF = self.parameterAsDouble(parameters, 'percF', context) # Frontal
+        otimizar = self.parameterAsEnum(parameters, 'rumo', context) == 1
+        velocidade = self.parameterAsDouble(parameters, 'velocidade', context)
+        margem = None
+        if self.parameterAsBoolean(parameters, 'recortar', context):
+            margem = self.parameterAsDouble(parameters, 'margem', context)
+        # Terrenos grandes são divididos em missões de até 'autonomia' minutos de voo
+        distanciaMax = velocidade * self.parameterAsDouble(parameters, 'autonomia', context) * 60
+        trabalhadores = self.parameterAsInt(parameters, 'trabalhadores', context)
+        mde = self.parameterAsRasterLayer(parameters, 'mde', context)
+        pastaCache = self.parameterAsFile(parameters, 'pastaCache', context)
 
         # =====Cálculo das Sobreposições====================================
         # Distância das linhas de voo paralelas - Espaçamento Lateral
@@ -75,316 +162,372 @@ class PlanoVooAlgorithm(QgsProcessingAlgorithm):
         deltaFront = SD_front * (H / h1 - 1)
 
         # =====================================================================
-        feedback.setCurrentStep(1)
+        feedback.setCurrentStep(0)
         if feedback.isCanceled():
             return {}
 
-        # =====Distâncias Extremas do Terreno==================================
-        # Distância do ponto mais ao Norte do mais ao Sul
-        # Distância do ponto mais a  Oeste do mais a  Leste
-
-        pontoN = None
-        pontoS = None
-        pontoW = None
-        pontoE = None
-
-        f = next(camada.getFeatures()) # Obter a primeira feature (único polígono)
+        # =====Anéis de todos os Terrenos da camada============================
+        # Cada feição (campo), ou cada missão dela se o Terreno for dividido, vira uma tarefa
+        # só com arrays, para rodar em paralelo.
+        # Os planos ficam no cache pela geometria e pelos parâmetros: se só a sobreposição
+        # frontal mudou, as linhas são reaproveitadas e só as fotos são recalculadas
+        CACHE_PLANOS.definirPasta(pastaCache)
+        ordemCampos = []
+        chaves = {}
+        planos = {}
+        tarefas = []
+        total = camada.featureCount() or 1
+        # a camada inteira cabe no cache, senão o fim do lote expulsa o começo
+        CACHE_PLANOS.maxItens = 2 * max(CAMPOS_CACHE, total)
+        for i, feat in enumerate(camada.getFeatures()):
+            if feedback.isCanceled():
+                return {}
+            feedback.setProgress(100 * i / total)
+
+            geom = feat.geometry()
+            if crs != crsCamada:
+                geom.transform(paraMetrico)
+            chaveLinhas = chaveCache(VERSAO_PLANO, bytes(geom.asWkb()), deltaLat, otimizar, margem, distanciaMax)
+            chavePlano = chaveCache(chaveLinhas, deltaFront)
+            chaves[feat.id()] = (chaveLinhas, chavePlano)
+            ordemCampos.append(feat.id())
+
+            # o cache guarda a lista de missões de cada campo
+            missoes = CACHE_PLANOS.obter(chavePlano)
+            if missoes is None:
+                linhas = CACHE_PLANOS.obter(chaveLinhas)
+                if linhas is not None:
+                    missoes = [fotosCampo(l, deltaFront) for l in linhas]
+                    CACHE_PLANOS.guardar(chavePlano, missoes)
+            if missoes is not None:
+                planos[feat.id()] = [dict(plano, campo=feat.id()) for plano in missoes]
+                continue
+
+            aneis = aneisTerreno(geom)
+            if not aneis:
+                continue
+            janelas = [None]
+            if distanciaMax > 0:
+                # todas as missões usam a grade de linhas do Terreno inteiro
+                janelas = dividirCampo(aneis, rumoCampo(aneis, deltaLat, otimizar), deltaLat, distanciaMax, margem or 0.0)
+                if len(janelas) == 1: # cabe numa missão: plano normal do Terreno inteiro
+                    janelas = [None]
+            for missao, janela in enumerate(janelas):
+                tarefas.append((feat.id(), aneis, deltaLat, deltaFront, otimizar, margem, janela, missao))
+
+        if planos:
+            feedback.pushInfo(f'{len(planos)} campo(s) reaproveitado(s) do cache')
 
-        geom = f.geometry() # Obter a geometria do polígono
-
-        for ponto in geom.vertices(): # Iterar sobre os vértices do Terreno p/obter as coordenadas + extremas
-            if pontoN is None or ponto.y() > pontoN.y():
-                pontoN = ponto
-            if pontoS is None or ponto.y() < pontoS.y():
-                pontoS = ponto
-            if pontoW is None or ponto.x() < pontoW.x():
-                pontoW = ponto
-            if pontoE is None or ponto.x() > pontoE.x():
-                pontoE = ponto
-
-        pN = pontoN.y()
-        pS = pontoS.y()
-        pW = pontoW.x()
-        pE = pontoE.x()
-
-        print('N',pN)
-        print('S',pS)
-        print('W',pW)
-        print('E',pE)
-
-        dNS = abs(pN-pS) # cálculo das distâncias extremas Norte-Sul
-        dWE = abs(pW-pE) # Oeste-Leste
-
-        print('Norte-Sul',dNS)
-        print('Oeste-Leste',dWE)
-
-         # =====================================================================
-        feedback.setCurrentStep(2)
+        # =====================================================================
+        feedback.setCurrentStep(1)
         if feedback.isCanceled():
             return {}
 
-        # =====Criar Linha do lado polígono mais ao Norte========================
-        maxNorte = float('-inf')
-        limiteMaisNorte = None
-
-        f = next(camada.getFeatures()) # Obter a primeira feature (único polígono)
-
-        geom = f.geometry() # Obter a geometria do polígono
-
-        pols = geom.asPolygon() # obter o Lado do Terreno mais ao Norte
-        for p in pols:
-            for i in range(len(p) - 1):
-                ponto1 = p[i]
-                ponto2 = p[i + 1]
-                pontoMedio = QgsPoint((ponto1.x() + ponto2.x()) / 2, (ponto1.y() + ponto2.y()) / 2)
-                if pontoMedio.y() > maxNorte: # obter a maior Latitude
-                    maxNorte = pontoMedio.y()
-                    limiteMaisNorte = (ponto1, ponto2)
-
-        p1, p2 = limiteMaisNorte
-        x1, y1 = p1.x(),p1.y()
-        x2, y2 = p2.x(),p2.y()
-
-        print(x1, y1)
-        print(x2, y2)
-        
-        p1 = QgsPointXY(x1, y1)
-        p2 = QgsPointXY(x2, y2)
-
-        dLinha = p1.distance(p2) # cálculo da medida da Linha
-        print('Medida da Linha',dLinha)
-        
-        if dWE > dLinha: # redefinindo o tamanho da Linha criada
-            extender = (dWE - dLinha) / 2
-
-        camadaLinha = QgsVectorLayer(f"LineString?crs={crs}", "Lado Mais ao Norte", "memory")
-        provider = camadaLinha.dataProvider()
-
-        provider.addAttributes([QgsField("ID", QVariant.Int)]) 
-        camadaLinha.updateFields() # Adicionar um campo de ID à nova camada
-
-        linha = QgsFeature() # Criar uma nova feição com a aresta mais ao norte
-        linha.setGeometry(QgsGeometry.fromPolylineXY([p1, p2]))
-        linha.setAttributes([1])
-
-        provider.addFeatures([linha]) # Adicionar a feição à camada
-        camadaLinha.updateExtents()
-
-        # =====================================================================
-        feedback.setCurrentStep(3)
+        # =====Linhas de Voo e Fotos de cada campo (processos em paralelo)======
+        # Para cada Terreno: lado mais ao Norte (ou melhor rumo), linhas //s em serpentina
+        # a cada deltaLat (recortadas no Terreno, se pedido) e pontos das fotos a cada deltaFront
+        # (ver Funcoes_Voo.planejarCampo)
+        novos = executar(planejarCampo, tarefas, trabalhadores, feedback)
         if feedback.isCanceled():
             return {}
-        
-        # =====Extender a Linha criada com os extremos W e E====================
-        if dWE > dLinha: # redefinindo o tamanho da Linha criada
-            estender = (dWE - dLinha) / 2 # metade no início e no fim
 
-        alg_params = {
-            'INPUT': camadaLinha,
-            'START_DISTANCE':estender,
-            'END_DISTANCE':estender,
-            'OUTPUT': QgsProcessing.TEMPORARY_OUTPUT
-        }
-
-        outputs['linhaExtendida'] = processing.run('native:extendlines', alg_params, context=context,
-                                                       feedback=feedback, is_child_algorithm=True)
+        # Missões sem nenhum trecho dentro do Terreno (cantos vazios da divisão) são descartadas
+        # e as restantes renumeradas na ordem de voo
+        novosCampos = {}
+        for tarefa, plano in zip(tarefas, novos):
+            if plano['linhas'] == 0:
+                continue
+            plano['aneis'] = tarefa[1]
+            novosCampos.setdefault(plano['campo'], []).append(plano)
+
+        for campo, missoes in novosCampos.items():
+            for missao, plano in enumerate(missoes):
+                plano['missao'] = missao
+            chaveLinhas, chavePlano = chaves[campo]
+            CACHE_PLANOS.guardar(chaveLinhas, [{k: v for k, v in plano.items()
+                                                if k not in ('campo', 'fotos', 'azimutes', 'linhaFotos')} for plano in missoes])
+            CACHE_PLANOS.guardar(chavePlano, missoes)
+            planos[campo] = missoes
+
+        planos = [plano for campo in ordemCampos for plano in planos.get(campo, [])]
+        if distanciaMax > 0:
+            feedback.pushInfo(f'{len(planos)} missão(ões) de até {distanciaMax:.0f} m de percurso')
+
+        if (otimizar or margem is not None) and distanciaMax <= 0: # economia em relação às linhas //s ao lado mais ao Norte
+            linhasMenos = sum(p['linhasNorte'] - p['linhas'] for p in planos) # trechos, se recortadas
+            metrosMenos = sum(p['comprimentoNorte'] - p['comprimento'] for p in planos)
+            feedback.pushInfo(f'Economia: {linhasMenos} linhas a menos e {metrosMenos:.1f} m '
+                              f'({metrosMenos / velocidade / 60:.1f} min de voo) a menos que o lado mais ao Norte')
 
         # =====================================================================
-        feedback.setCurrentStep(4)
-        if feedback.isCanceled():
-            return {}
-        
-        # =====Linhas paralelas a partir da Linha criada=======================
-        n = int(dNS / deltaLat) * -1 # número de Linhas e negativo N para S
-        alg_params = {
-            'INPUT': outputs['linhaExtendida']['OUTPUT'],
-            'COUNT':n,
-            'OFFSET':deltaLat,
-            'SEGMENTS':8,
-            'JOIN_STYLE':0,
-            'MITER_LIMIT':2,
-            'OUTPUT': QgsProcessing.TEMPORARY_OUTPUT
-        }
-
-        outputs['linhas'] = processing.run('native:arrayoffsetlines', alg_params, context=context,
-                                                       feedback=feedback, is_child_algorithm=True)
-        
-       # =====================================================================
-        feedback.setCurrentStep(5)
+        feedback.setCurrentStep(2)
         if feedback.isCanceled():
             return {}
-        
-        # =====Unir as Linhas //s ============================================
-        camadaLinhas = context.getMapLayer(outputs['linhas']['OUTPUT'])
-
-        todasLinhas = [f for f in camadaLinhas.getFeatures()]
-
-        paresPontos = []
-        for i, f in enumerate(todasLinhas): # obtém os pares de Pontos de cada Linha
-            geom = f.geometry()
-            p = geom.asPolyline()
-            
-            p1, p2 = p[0], p[1]
-            paresPontos.append([p1,p2])
-            
-        # print(paresPontos)
-
-        pontosOrdenados = sorted(paresPontos, key=lambda sublist: sublist[0].y(), reverse=True)
 
-        # for sublist in pontosOrdenados:
-        #     print("\n".join([str(point) for point in sublist]))
-        #     print()  # Adiciona uma linha em branco entre cada sublista
+        # =====Linha de Voo única por missão, direto dos vértices ordenados=====
+        # O caminho já está na ordem da serpentina (ida, ligação, volta...),
+        # então cada LineString é montada de uma vez, sem unir as linhas uma a uma
+        camposLinha = QgsFields()
+        camposLinha.append(QgsField("campo", QVariant.Int))
+        camposLinha.append(QgsField("missao", QVariant.Int))
+        (linhaVoo, self.idLinhaVoo) = self.parameterAsSink(parameters, 'linhaVoo', context, camposLinha,
+                                                           QgsWkbTypes.LineString, crsCamada)
+
+        for i, plano in enumerate(planos):
+            if feedback.isCanceled():
+                return {}
+            feedback.setProgress(100 * i / len(planos))
+            nova_feature = QgsFeature(camposLinha)
+            nova_feature.setAttributes([plano['campo'], plano['missao']])
+            caminho = transformarXY(plano['caminho'], paraCamada)
+            nova_feature.setGeometry(QgsGeometry.fromPolylineXY([QgsPointXY(x, y) for x, y in caminho]))
+            linhaVoo.addFeature(nova_feature, QgsFeatureSink.FastInsert)
 
-        pontos = [] # pontos para a uniao com as linhas //s
-        i = 0
-
-        for p in pontosOrdenados:
-            if i%2 == 0:
-                p = QgsPointXY(p[1].x(), p[1].y())
-            else:
-                p = QgsPointXY(p[0].x(), p[0].y())
-            
-            p1, p2 = p[0], p[1]
-            
-            i+=1    
-            # print(p1,p2)
-            
-            pontos.append(p)
-
-        # print(pontos)
-
-        # Criar as novas linhas unindo cada par de pontos à linha correspondente
-        camadaLinhas.startEditing()
-
-        for i, p1 in enumerate(pontos):
-            # print(i, p)
-
-            try:
-                p2 = pontosOrdenados[i+1][1] if i%2 == 0 else pontosOrdenados[i+1][0]
-                # if i%2 == 0:
-                #     p2 = pontosOrdenados[i+1][1]
-                # else:
-                #     p2 = pontosOrdenados[i+1][0]
-                
-                # print(p2)
-            except IndexError:
-                break
-
-            novaLinha = QgsFeature() # criar uma linha com os pontos p1 e p2 
-            novaLinha.setGeometry(QgsGeometry.fromPolylineXY([p1, p2]))
-            camadaLinhas.dataProvider().addFeatures([novaLinha])
-            
-        camadaLinhas.updateExtents()
-        camadaLinhas.commitChanges()
-        
-      # =======================================================================
-        feedback.setCurrentStep(6)
+     # =======================================================================
+        feedback.setCurrentStep(3)
         if feedback.isCanceled():
             return {}
         
-        # =====Transformar várias linhas em uma só==============================
-        geomTotal = None
-
-        # Iterar sobre as features da camada de entrada para unir todas as geometrias
-        for f in camadaLinhas.getFeatures():
-            geom = f.geometry()
-            if geomTotal is None:
-                geomTotal = geom
+        # =====Pontos das Fotos a cada deltaFront sobre a linha===============
+        campos = QgsFields()
+        campos.append(QgsField("campo", QVariant.Int))
+        campos.append(QgsField("missao", QVariant.Int))
+        campos.append(QgsField("id", QVariant.Int))
+        campos.append(QgsField("linha", QVariant.Int))
+        campos.append(QgsField("latitude", QVariant.Double))
+        campos.append(QgsField("longitude", QVariant.Double))
+        campos.append(QgsField("cota", QVariant.Double))
+        campos.append(QgsField("altitude", QVariant.Double))
+        campos.append(QgsField("deltaFront", QVariant.Double))
+        campos.append(QgsField("deltaLat", QVariant.Double))
+        (pontos, self.idPontos) = self.parameterAsSink(parameters, 'pontos', context, campos,
+                                                       QgsWkbTypes.Point, crsCamada)
+
+        # Estatísticas de cada missão
+        camposEstat = QgsFields()
+        camposEstat.append(QgsField("campo", QVariant.Int))
+        camposEstat.append(QgsField("missao", QVariant.Int))
+        camposEstat.append(QgsField("linhas", QVariant.Int))
+        camposEstat.append(QgsField("comprimento", QVariant.Double))
+        camposEstat.append(QgsField("fotos", QVariant.Int))
+        camposEstat.append(QgsField("azimute", QVariant.Double))
+        camposEstat.append(QgsField("tempo_min", QVariant.Double))
+        camposEstat.append(QgsField("economia_min", QVariant.Double))
+        (estatisticas, idEstat) = self.parameterAsSink(parameters, 'estatisticas', context, camposEstat,
+                                                       QgsWkbTypes.NoGeometry)
+
+        # Com MDE: cota de cada foto lida em lote só nos blocos do raster que têm fotos,
+        # altitude = cota + H e espaçamentos corrigidos pela declividade
+        if mde is not None:
+            paraMde = transformacao(crs, mde.crs(), context.transformContext())
+
+            def amostrar(xy):
+                xy = transformarXY(xy, paraMde)
+                return amostrarRaster(mde.source(), xy[:, 0], xy[:, 1])
+
+        # Os pontos de cada missão ficam em colunas (PontosVoo), sem uma feição por foto na memória
+        partes = []
+        for plano in planos:
+            fotos = plano['fotos']
+            if mde is not None:
+                cota, altitude, frente, lateral = ajusteTerreno(fotos, plano['rumo'], amostrar,
+                                                                H, deltaFront, deltaLat)
             else:
-                geomTotal = geomTotal.combine(geom)
-
-        # Criar a nova feature com a geometria unificada
-        nova_feature = QgsFeature()
-        nova_feature.setGeometry(geomTotal)
-
-        # Criar a nova camada temporária
-        camadaLinhaVoo = QgsVectorLayer("Linestring?crs=crs", "LinhaVoo", "memory")
-
-        camadaLinhaVoo.dataProvider().addFeatures([nova_feature])
-
-        # Criar o símbolo de linha
-        simbolo = QgsSimpleLineSymbolLayer.create({'color': '#fd1b07', 'width': 1.45})
-        s = QgsLineSymbol([simbolo])
-        camadaLinhaVoo.renderer().setSymbol(s)
+                cota, altitude, frente, lateral = np.nan, H, deltaFront, abs(deltaLat)
+            saida = transformarXY(fotos, paraCamada)
+            lonLat = transformarXY(fotos, paraWgs84)
+            partes.append(PontosVoo(campo=plano['campo'], missao=plano['missao'], id=np.arange(len(fotos)),
+                                    linha=plano['linhaFotos'], x=saida[:, 0], y=saida[:, 1],
+                                    longitude=lonLat[:, 0], latitude=lonLat[:, 1], cota=cota, altitude=altitude,
+                                    azimute=plano['azimutes'], frente=frente, lateral=lateral))
+
+            estat = QgsFeature(camposEstat)
+            azimute = (90 - math.degrees(plano['rumo'])) % 180 # azimute da direção das linhas (0° a 180°)
+            estat.setAttributes([plano['campo'], plano['missao'], plano['linhas'], plano['comprimento'], len(fotos),
+                                 azimute, plano['comprimento'] / velocidade / 60,
+                                 (plano['comprimentoNorte'] - plano['comprimento']) / velocidade / 60])
+            estatisticas.addFeature(estat, QgsFeatureSink.FastInsert)
+
+        todos = PontosVoo.juntar(partes)
+        del partes
+
+        # As feições só existem um lote (TAM_BUFFER) por vez; o progresso e o
+        # cancelamento são verificados a cada lote
+        for ini, fim in todos.lotes(TAM_BUFFER):
+            if feedback.isCanceled():
+                return {}
+            feedback.setProgress(100 * ini / len(todos))
+            colunas = [getattr(todos, nome)[ini:fim].tolist() for nome in
+                       ('campo', 'missao', 'id', 'linha', 'latitude', 'longitude', 'cota', 'altitude', 'frente', 'lateral')]
+            lote = []
+            for campo, missao, pontoID, linha, lat, lon, cota, altitude, frente, lateral, x, y in zip(
+                    *colunas, todos.x[ini:fim].tolist(), todos.y[ini:fim].tolist()):
+                nova_feature = QgsFeature(campos)
+                nova_feature.setAttributes([campo, missao, pontoID, linha, lat, lon,
+                                            None if math.isnan(cota) else cota,
+                                            None if math.isnan(altitude) else altitude, frente, lateral])
+                nova_feature.setGeometry(QgsGeometry.fromPointXY(QgsPointXY(x, y)))
+                lote.append(nova_feature)
+            pontos.addFeatures(lote, QgsFeatureSink.FastInsert)
+
+        resultados = {'linhaVoo': self.idLinhaVoo, 'pontos': self.idPontos, 'estatisticas': idEstat}
+
+        # =====Arquivo dos Pontos (opcional)====================================
+        # GeoPackage ou GeoParquet/GeoArrow gravado direto das colunas, em WGS84 com a altitude
+        saidaArquivo = self.parameterAsFileOutput(parameters, 'arquivoPontos', context)
+        if saidaArquivo:
+            try:
+                resultados['arquivoPontos'] = exportarPontos(saidaArquivo, todos, TAM_BUFFER)
+            except ImportError as erro:
+                raise QgsProcessingException(str(erro))
+
+        # =====Arquivo da Missão (opcional)=====================================
+        # Litchi CSV ou KML, em WGS84. Cada missão é identificada por <campo>-<missao>: uma pasta
+        # no KML ou, no Litchi, um arquivo por missão quando há mais de uma. As alturas são em
+        # relação à decolagem (1º waypoint da missão): com MDE, altitude - cota da decolagem.
+        # Pontos fora do MDE ficam com a cota da decolagem (voam a H acima dela), como no Litchi
+        saidaMissao = self.parameterAsFileOutput(parameters, 'missao', context)
+        if saidaMissao:
+            # KML: um waypoint por foto, gravado em blocos direto das colunas dos pontos
+            def waypoints():
+                codigo = todos.campo.astype(np.int64) * (int(todos.missao.max(initial=0)) + 1) + todos.missao
+                cotaDecolagem = cotasDecolagem(todos.cota, codigo)
+                cota = np.where(np.isnan(todos.cota), cotaDecolagem, todos.cota)
+                altitude = np.where(np.isnan(todos.altitude), cota + H, todos.altitude)
+                altura = np.where(np.isnan(cotaDecolagem), H, altitude - cotaDecolagem)
+                for ini, fim in todos.lotes(TAM_BUFFER):
+                    if feedback.isCanceled():
+                        return
+                    for campo, missao, pontoID, lon, lat, alt, h, az in zip(
+                            todos.campo[ini:fim].tolist(), todos.missao[ini:fim].tolist(), todos.id[ini:fim].tolist(),
+                            todos.longitude[ini:fim].tolist(), todos.latitude[ini:fim].tolist(),
+                            altitude[ini:fim].tolist(), altura[ini:fim].tolist(), todos.azimute[ini:fim].tolist()):
+                        yield f'{campo}-{missao}', pontoID, lon, lat, alt, h, az
+
+            # Litchi: waypoints só nas pontas das linhas (o caminho é início, fim de cada linha),
+            # com as fotos a cada deltaFront ao longo da linha e nenhuma na ligação para a seguinte
+            missoes = []
+            for plano in planos:
+                caminho = plano['caminho']
+                lonLat = transformarXY(caminho, paraWgs84)
+                azLinha = np.repeat(azimutes(caminho[0::2], caminho[1::2]), 2)
+                altura = np.full(len(caminho), float(H))
+                if mde is not None and len(caminho):
+                    cota = amostrar(caminho)
+                    cotaDecolagem = cotasDecolagem(cota, np.zeros(len(cota)))
+                    if not np.isnan(cotaDecolagem[0]):
+                        altura = H + np.where(np.isnan(cota), cotaDecolagem, cota) - cotaDecolagem
+                intervalo = np.where(np.arange(len(caminho)) % 2 == 0, deltaFront, -1.0)
+                missoes.append((f"{plano['campo']}-{plano['missao']}",
+                                list(zip(lonLat[:, 0].tolist(), lonLat[:, 1].tolist(), altura.tolist(),
+                                         azLinha.tolist(), intervalo.tolist()))))
+
+            linhasWgs84 = {f"{plano['campo']}-{plano['missao']}": transformarXY(plano['caminho'], paraWgs84).tolist()
+                           for plano in planos}
+            arquivos = exportarMissao(saidaMissao, linhasWgs84, waypoints(), missoes, mde is not None)
+            if feedback.isCanceled():
+                return {}
+            # a saída de arquivo é um caminho só; com vários arquivos a lista completa vai em arquivosMissao
+            resultados['missao'] = arquivos[0]
+            resultados['arquivosMissao'] = ';'.join(arquivos)
+            if len(arquivos) > 1:
+                feedback.pushInfo(f'Missão gravada em {len(arquivos)} arquivos (até 99 waypoints cada): '
+                                  + ', '.join(os.path.basename(a) for a in arquivos))
 
-        camadaLinhaVoo.triggerRepaint()
-        QgsProject.instance().addMapLayer(camadaLinhaVoo)
 
      # =======================================================================
-        feedback.setCurrentStep(7)
+        feedback.setCurrentStep(4)
         if feedback.isCanceled():
             return {}
-        
-        # =====Criar uma camada Ponto com os deltaFront sobre a linha===========
-        camadaPontos = QgsVectorLayer(f"Point?crs={crs}", "Pontos", "memory")
-        dados = camadaPontos.dataProvider()
 
-        # Definir campos
-        campos = QgsFields()
-        campos.append(QgsField("id", QVariant.Int))
-        campos.append(QgsField("latitude", QVariant.Double))
-        campos.append(QgsField("longitude", QVariant.Double))
-        dados.addAttributes(campos)
-        camadaPontos.updateFields()
-
-        # Iterar sobre as linhas e criar pontos espaçados
-        features = camadaLinhaVoo.getFeatures()
-        pontoID = 0
-
-        for f in features:
-            geom = f.geometry()
-            distVoo = geom.length()
-            
-            x = 0
-            while x < distVoo:
-                ponto = geom.interpolate(x).asPoint()
-                
-                nova_feature = QgsFeature()
-                nova_feature.setFields(campos)
-                nova_feature.setAttribute("id", pontoID)
-                nova_feature.setAttribute("latitude", ponto.y())
-                nova_feature.setAttribute("longitude", ponto.x())
-                
-                nova_feature.setGeometry(QgsGeometry.fromPointXY(QgsPointXY(ponto)))
-                
-                dados.addFeature(nova_feature)
-                
-                pontoID += 1
-                x += deltaFront
-
-        # Adicionar camada de pontos ao projeto
-        QgsProject.instance().addMapLayer(camadaPontos)
-
-        # Simbologia e Rótulo
-        simbolo = QgsMarkerSymbol.createSimple({'color': 'blue', 'size': '3'})
-        renderer = QgsSingleSymbolRenderer(simbolo)
-        camadaPontos.setRenderer(renderer)
-
-        settings = QgsPalLayerSettings()
-        settings.fieldName = "id"
-        settings.isExpression = True
-        settings.enabled = True
-
-        textoF = QgsTextFormat()
-        textoF.setFont(QFont("Arial", 10, QFont.Bold))
-        textoF.setSize(10)
-
-        bufferS = QgsTextBufferSettings()
-        bufferS.setEnabled(True)
-        bufferS.setSize(1)  # Tamanho do buffer em milímetros
-        bufferS.setColor(QColor("white"))  # Cor do buffer
-
-        textoF.setBuffer(bufferS)
-        settings.setFormat(textoF)
-
-        camadaPontos.setLabelsEnabled(True)
-        camadaPontos.setLabeling(QgsVectorLayerSimpleLabeling(settings))
-
-        camadaPontos.triggerRepaint()
-        QgsProject.instance().addMapLayer(camadaPontos)
-
-        return
-    
+        # =====Cobertura das Fotos (opcional)==================================
+        # Conta quantas fotos (retângulos D_front x D_lat no chão) cobrem cada célula do Terreno
+        saidaCobertura = self.parameterAsOutputLayer(parameters, 'cobertura', context)
+        if saidaCobertura and planos:
+            minFotos = self.parameterAsInt(parameters, 'minFotos', context)
+            px = self.parameterAsDouble(parameters, 'tamPixel', context)
+
+            todos = np.concatenate([anel for plano in planos for anel in plano['aneis']])
+            x0, y0 = todos[:, 0].min(), todos[:, 1].max()
+            largura, altura = todos[:, 0].max() - x0, y0 - todos[:, 1].min()
+            if px <= 0: # automático: até 2000 células no maior lado
+                px = max(largura, altura) / 2000
+            nx, ny = int(np.ceil(largura / px)), int(np.ceil(altura / px))
+
+            contagem = np.zeros((ny, nx), dtype=np.int32)
+            dentro = np.zeros((ny, nx), dtype=bool)
+            mascarados = set()
+            for i, plano in enumerate(planos):
+                if feedback.isCanceled():
+                    return {}
+                feedback.setProgress(100 * i / len(planos))
+                acumularFotos(contagem, x0, y0, px, plano['fotos'], plano['rumo'], D_lat, D_front)
+                if plano['campo'] not in mascarados: # as missões de um campo têm os mesmos anéis
+                    dentro |= mascaraPoligono(plano['aneis'], x0, y0, px, nx, ny)
+                    mascarados.add(plano['campo'])
+
+            gravarGeoTiff(saidaCobertura, np.where(dentro, contagem, -1), x0, y0, px, crs.toWkt(), -1)
+
+            noTerreno = contagem[dentro]
+            resultados['cobertura'] = saidaCobertura
+            resultados['sobreposicaoMinima'] = int(noTerreno.min()) if noTerreno.size else 0
+            resultados['celulasPoucasFotos'] = int((noTerreno < minFotos).sum())
+            resultados['redundancia'] = float(noTerreno.mean()) if noTerreno.size else 0.0
+
+            feedback.pushInfo(f"Cobertura: mínimo de {resultados['sobreposicaoMinima']} fotos por célula, "
+                              f"{resultados['celulasPoucasFotos']} células com menos de {minFotos} fotos, "
+                              f"média de {resultados['redundancia']:.1f} fotos por célula")
+
+        self.resultados = resultados
+        return resultados
+
+    def postProcessAlgorithm(self, context, feedback):
+        # Simbologia e rótulos só com a interface gráfica do QGIS: no qgis_process e em
+        # scripts o algoritmo só grava as saídas, sem montar renderizadores nem rótulos.
+        # O retorno substitui os resultados do processAlgorithm: vai a cópia completa deles
+        saidas = dict(self.resultados)
+        if QgsApplication.platform() != 'desktop' or self.idLinhaVoo is None:
+            return saidas
+
+        camadaLinhaVoo = QgsProcessingUtils.mapLayerFromString(self.idLinhaVoo, context)
+        if camadaLinhaVoo is not None:
+            # Criar o símbolo de linha
+            simbolo = QgsSimpleLineSymbolLayer.create({'color': '#fd1b07', 'width': 1.45})
+            s = QgsLineSymbol([simbolo])
+            camadaLinhaVoo.renderer().setSymbol(s)
+            camadaLinhaVoo.triggerRepaint()
+
+        camadaPontos = QgsProcessingUtils.mapLayerFromString(self.idPontos, context)
+        if camadaPontos is not None:
+            # Simbologia e Rótulo
+            simbolo = QgsMarkerSymbol.createSimple({'color': 'blue', 'size': '3'})
+            renderer = QgsSingleSymbolRenderer(simbolo)
+            camadaPontos.setRenderer(renderer)
+
+            settings = QgsPalLayerSettings()
+            settings.fieldName = "id"
+            settings.isExpression = True
+            settings.enabled = True
+
+            textoF = QgsTextFormat()
+            textoF.setFont(QFont("Arial", 10, QFont.Bold))
+            textoF.setSize(10)
+
+            bufferS = QgsTextBufferSettings()
+            bufferS.setEnabled(True)
+            bufferS.setSize(1)  # Tamanho do buffer em milímetros
+            bufferS.setColor(QColor("white"))  # Cor do buffer
+
+            textoF.setBuffer(bufferS)
+            settings.setFormat(textoF)
+
+            camadaPontos.setLabelsEnabled(True)
+            camadaPontos.setLabeling(QgsVectorLayerSimpleLabeling(settings))
+
+            camadaPontos.triggerRepaint()
+
+        return saidas
+
     def name(self):
         return 'Linha de Voo e Pontos Fotos'
 
@@ -410,7 +553,9 @@ class PlanoVooAlgorithm(QgsProcessingAlgorithm):
         return QIcon(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'images/topoGeoone.png'))
     
     texto = "Este algoritmo calcula a sobreposição lateral e frontal de Voo de Drone, \
-            fornecendo uma camada da 'Linha do Voo' e uma camada dos 'Pontos' para Fotos"
+            fornecendo uma camada da 'Linha do Voo' e uma camada dos 'Pontos' para Fotos. \
+            Todos os polígonos da camada são planejados (em paralelo), identificados pelo campo 'campo'. \
+            Com um tempo máximo por missão, Terrenos grandes são divididos em missões (campo 'missao')"
     figura = 'images/PlanoVoo4.jpg'
 
     def shortHelpString(self):
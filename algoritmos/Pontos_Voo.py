@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+__author__ = 'profCazaroli'
+__date__ = '2024-07-04'
+__copyright__ = '(C) 2024 by profCazaroli'
+__revision__ = '$Format:%H$'
+
+# Pontos das fotos em colunas NumPy (uma coluna por atributo, sem objeto Python por ponto)
+# e exportação direto das colunas para GeoPackage e GeoParquet/GeoArrow
+#
+# As geometrias exportadas são PointZ em WGS84 (longitude, latitude, altitude), montadas em
+# lote como WKB num único array estruturado
+
+import json
+import os
+import sqlite3
+import numpy as np
+
+try:
+    import pyarrow as pa
+    import pyarrow.feather as feather
+    import pyarrow.parquet as pq
+except ImportError: # GeoParquet/GeoArrow só com o pyarrow instalado
+    pa = None
+
+TAM_LOTE = 5000
+
+class PontosVoo:
+    # (nome, tipo) de cada coluna; x, y no CRS da camada e longitude, latitude em WGS84
+    COLUNAS = (('campo', np.int32), ('missao', np.int32), ('id', np.int32), ('linha', np.int32),
+               ('x', np.float64), ('y', np.float64), ('longitude', np.float64), ('latitude', np.float64),
+               ('cota', np.float32), ('altitude', np.float32), ('azimute', np.float32),
+               ('frente', np.float32), ('lateral', np.float32))
+
+    def __init__(self, **colunas):
+        n = max((np.size(valor) for valor in colunas.values() if np.ndim(valor) > 0), default=0)
+        for nome, tipo in self.COLUNAS:
+            # valores escalares (campo, missao...) são repetidos para todos os pontos
+            setattr(self, nome, np.broadcast_to(np.asarray(colunas[nome], dtype=tipo), (n,)).copy())
+
+    @classmethod
+    def juntar(cls, partes):
+        partes = list(partes)
+        return cls(**{nome: np.concatenate([getattr(p, nome) for p in partes]) if partes else np.empty(0, tipo)
+                      for nome, tipo in cls.COLUNAS})
+
+    def __len__(self):
+        return len(self.id)
+
+    def nbytes(self):
+        return sum(getattr(self, nome).nbytes for nome, _ in self.COLUNAS)
+
+    def lotes(self, tamLote=TAM_LOTE):
+        # Intervalos [ini, fim) de até tamLote pontos
+        for ini in range(0, len(self), tamLote):
+            yield ini, min(ini + tamLote, len(self))
+
+    def wkb(self, cabecalhoGpkg=False):
+        # PointZ em WKB (little endian) de todos os pontos, como um array estruturado:
+        # a linha i (.tobytes()) é a geometria do ponto i. Com cabecalhoGpkg, cada uma vem
+        # com o cabeçalho binário do GeoPackage (sem envelope, srs 4326)
+        campos = [('ordem', 'u1'), ('tipo', '<u4'), ('x', '<f8'), ('y', '<f8'), ('z', '<f8')]
+        if cabecalhoGpkg:
+            campos = [('magica', 'S2'), ('versao', 'u1'), ('flags', 'u1'), ('srs', '<i4')] + campos
+        blobs = np.empty(len(self), dtype=np.dtype(campos))
+        if cabecalhoGpkg:
+            blobs['magica'] = b'GP'
+            blobs['versao'] = 0
+            blobs['flags'] = 1
+            blobs['srs'] = 4326
+        blobs['ordem'] = 1
+        blobs['tipo'] = 1001 # Point Z
+        blobs['x'] = self.longitude
+        blobs['y'] = self.latitude
+        blobs['z'] = self.altitude
+        return blobs
+
+    def extensao(self):
+        if not len(self):
+            return [0.0, 0.0, 0.0, 0.0]
+        return [float(self.longitude.min()), float(self.latitude.min()),
+                float(self.longitude.max()), float(self.latitude.max())]
+
+ATRIBUTOS = ('campo', 'missao', 'id', 'linha', 'cota', 'altitude', 'azimute', 'frente', 'lateral')
+
+WKT_WGS84 = ('GEOGCS["WGS 84",DATUM["WGS_1984",SPHEROID["WGS 84",6378137,298.257223563,'
+             'AUTHORITY["EPSG","7030"]],AUTHORITY["EPSG","6326"]],PRIMEM["Greenwich",0,'
+             'AUTHORITY["EPSG","8901"]],UNIT["degree",0.0174532925199433,AUTHORITY["EPSG","9122"]],'
+             'AUTHORITY["EPSG","4326"]]')
+
+def gravarGeoPackage(caminho, pontos, nomeTabela='pontos', tamLote=TAM_LOTE):
+    # GeoPackage mínimo (tabelas gpkg_* obrigatórias) gravado com o sqlite3 da biblioteca padrão
+    if os.path.exists(caminho):
+        os.remove(caminho)
+
+    blobs = pontos.wkb(cabecalhoGpkg=True)
+    tipos = {'campo': 'INTEGER', 'missao': 'INTEGER', 'id': 'INTEGER', 'linha': 'INTEGER'}
+    colunas = ', '.join(f'"{nome}" {tipos.get(nome, "DOUBLE")}' for nome in ATRIBUTOS)
+    minX, minY, maxX, maxY = pontos.extensao()
+
+    conexao = sqlite3.connect(caminho)
+    try:
+        conexao.executescript(f'''
+            PRAGMA application_id = 1196444487;
+            PRAGMA user_version = 10200;
+            CREATE TABLE gpkg_spatial_ref_sys (srs_name TEXT NOT NULL, srs_id INTEGER PRIMARY KEY,
+                organization TEXT NOT NULL, organization_coordsys_id INTEGER NOT NULL,
+                definition TEXT NOT NULL, description TEXT);
+            CREATE TABLE gpkg_contents (table_name TEXT NOT NULL PRIMARY KEY, data_type TEXT NOT NULL,
+                identifier TEXT UNIQUE, description TEXT DEFAULT '',
+                last_change DATETIME NOT NULL DEFAULT (strftime('%Y-%m-%dT%H:%M:%fZ','now')),
+                min_x DOUBLE, min_y DOUBLE, max_x DOUBLE, max_y DOUBLE, srs_id INTEGER,
+                CONSTRAINT fk_gc_r_srs_id FOREIGN KEY (srs_id) REFERENCES gpkg_spatial_ref_sys(srs_id));
+            CREATE TABLE gpkg_geometry_columns (table_name TEXT NOT NULL, column_name TEXT NOT NULL,
+                geometry_type_name TEXT NOT NULL, srs_id INTEGER NOT NULL, z TINYINT NOT NULL, m TINYINT NOT NULL,
+                CONSTRAINT pk_geom_cols PRIMARY KEY (table_name, column_name),
+                CONSTRAINT fk_gc_tn FOREIGN KEY (table_name) REFERENCES gpkg_contents(table_name),
+                CONSTRAINT fk_gc_srs FOREIGN KEY (srs_id) REFERENCES gpkg_spatial_ref_sys (srs_id));
+            CREATE TABLE "{nomeTabela}" (fid INTEGER PRIMARY KEY AUTOINCREMENT NOT NULL, geom POINT, {colunas});
+        ''')
+        conexao.executemany('INSERT INTO gpkg_spatial_ref_sys VALUES (?, ?, ?, ?, ?, ?)', [
+            ('Undefined cartesian SRS', -1, 'NONE', -1, 'undefined', None),
+            ('Undefined geographic SRS', 0, 'NONE', 0, 'undefined', None),
+            ('WGS 84 geodetic', 4326, 'EPSG', 4326, WKT_WGS84, None)])
+        conexao.execute('INSERT INTO gpkg_contents (table_name, data_type, identifier, min_x, min_y, max_x, max_y, srs_id) '
+                        'VALUES (?, ?, ?, ?, ?, ?, ?, ?)', (nomeTabela, 'features', nomeTabela, minX, minY, maxX, maxY, 4326))
+        conexao.execute('INSERT INTO gpkg_geometry_columns VALUES (?, ?, ?, ?, ?, ?)',
+                        (nomeTabela, 'geom', 'POINT', 4326, 1, 0))
+
+        sql = (f'INSERT INTO "{nomeTabela}" (geom, {", ".join(ATRIBUTOS)}) '
+               f'VALUES ({", ".join("?" * (len(ATRIBUTOS) + 1))})')
+        for ini, fim in pontos.lotes(tamLote):
+            valores = [getattr(pontos, nome)[ini:fim].tolist() for nome in ATRIBUTOS]
+            geometrias = (blob.tobytes() for blob in blobs[ini:fim])
+            conexao.executemany(sql, zip(geometrias, *valores))
+        conexao.commit()
+    finally:
+        conexao.close()
+
+    return caminho
+
+def gravarGeoArrow(caminho, pontos, tamLote=TAM_LOTE):
+    # GeoParquet 1.0 (.parquet) ou Arrow IPC (.arrow/.feather), com a geometria em WKB
+    # (extensão geoarrow.wkb). As colunas NumPy entram na tabela Arrow sem cópia
+    blobs = pontos.wkb()
+    tamanho = blobs.dtype.itemsize
+    offsets = np.arange(0, tamanho * (len(pontos) + 1), tamanho, dtype=np.int32)
+    geometria = pa.Array.from_buffers(pa.binary(), len(pontos),
+                                      [None, pa.py_buffer(offsets), pa.py_buffer(blobs.view(np.uint8))])
+
+    campoGeometria = pa.field('geometry', pa.binary(), metadata={'ARROW:extension:name': 'geoarrow.wkb',
+                                                                 'ARROW:extension:metadata': '{}'})
+    colunas = [pa.array(getattr(pontos, nome)) for nome in ATRIBUTOS] + [geometria]
+    esquema = pa.schema([pa.field(nome, coluna.type) for nome, coluna in zip(ATRIBUTOS, colunas)] + [campoGeometria])
+
+    # sem 'crs' o padrão do GeoParquet é OGC:CRS84 (longitude, latitude), que é o caso
+    geo = {'version': '1.0.0', 'primary_column': 'geometry',
+           'columns': {'geometry': {'encoding': 'WKB', 'geometry_types': ['Point Z'], 'bbox': pontos.extensao()}}}
+    esquema = esquema.with_metadata({'geo': json.dumps(geo)})
+    tabela = pa.Table.from_arrays(colunas, schema=esquema)
+
+    if caminho.lower().endswith('.parquet'):
+        pq.write_table(tabela, caminho, row_group_size=max(tamLote, 64 * 1024))
+    else:
+        feather.write_feather(tabela, caminho)
+    return caminho
+
+def exportarPontos(caminho, pontos, tamLote=TAM_LOTE):
+    # Escolhe o formato pela extensão do arquivo
+    if caminho.lower().endswith('.gpkg'):
+        return gravarGeoPackage(caminho, pontos, tamLote=tamLote)
+    if pa is None:
+        raise ImportError('GeoParquet/GeoArrow precisa do pacote pyarrow')
+    return gravarGeoArrow(caminho, pontos, tamLote)
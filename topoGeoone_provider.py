@@ -5,8 +5,9 @@ __copyright__ = '(C) 2024 by profCazaroli'
 __revision__ = '$Format:%H$'
 
 from qgis.core import QgsProcessingProvider
-from .algoritmos.Divide_Lote_Buffer import divideLoteBufferAlgorithm
+from .algoritmos.Dividir_Lotes import dividirLotesAlgorithm
 from .algoritmos.Angulos_Internos import AngulosInternosAlgorithm
+from .algoritmos.Memorial_Descritivo import MemorialDescritivoAlgorithm
 from .algoritmos.Plano_de_Voo import PlanoVooAlgorithm
 from qgis.PyQt.QtGui import QIcon
 import os
@@ -19,8 +20,9 @@ class topoGeooneProvider(QgsProcessingProvider):
         pass
 
     def loadAlgorithms(self):
-        self.addAlgorithm(divideLoteBufferAlgorithm())
+        self.addAlgorithm(dividirLotesAlgorithm())
         self.addAlgorithm(AngulosInternosAlgorithm())
+        self.addAlgorithm(MemorialDescritivoAlgorithm())
         self.addAlgorithm(PlanoVooAlgorithm())
 
     def id(self):